@@ -1,9 +1,14 @@
+import sys
 from pathlib import Path
 
 import pygame
 
 ASSET_DIR = Path(__file__).resolve().parent.parent / "assets"
 
+# 碰撞遮罩与 Q-learning 游戏共用按内容哈希缓存的 hitmask_cache
+sys.path.append(str(Path(__file__).resolve().parents[2] / "flappybird-qlearning" / "src"))
+from hitmask_cache import sprite_hitmasks
+
 
 def load():
     # 玩家精灵不同状态的图片路径
@@ -65,24 +70,15 @@ def load():
         pygame.image.load(PIPE_PATH).convert_alpha(),
     )
 
-    # 管道的碰撞检测遮罩
-    HITMASKS["pipe"] = (getHitmask(IMAGES["pipe"][0]), getHitmask(IMAGES["pipe"][1]))
+    # 管道的碰撞检测遮罩（颠倒和正常状态），从缓存读取，精灵文件改变时自动重新计算
+    HITMASKS["pipe"] = tuple(mask.tolist() for mask in sprite_hitmasks([(PIPE_PATH, 180), (PIPE_PATH, 0)]))
 
     # 玩家精灵的碰撞检测遮罩
-    HITMASKS["player"] = (
-        getHitmask(IMAGES["player"][0]),
-        getHitmask(IMAGES["player"][1]),
-        getHitmask(IMAGES["player"][2]),
-    )
+    HITMASKS["player"] = tuple(mask.tolist() for mask in sprite_hitmasks([(path, 0) for path in PLAYER_PATH]))
 
     return IMAGES, SOUNDS, HITMASKS
 
 
-def getHitmask(image):
-    """返回一个基于图片 alpha 通道的碰撞遮罩。"""
-    mask = []
-    for x in range(image.get_width()):
-        mask.append([])
-        for y in range(image.get_height()):
-            mask[x].append(bool(image.get_at((x, y))[3]))
-    return mask
+def packHitmask(hitmask):
+    """把碰撞遮罩按列打包成整数：第 y 位为 1 表示该列第 y 个像素不透明。"""
+    return tuple(sum(1 << y for y, opaque in enumerate(column) if opaque) for column in hitmask)
@@ -24,6 +24,8 @@ SCREEN = pygame.display.set_mode((SCREENWIDTH, SCREENHEIGHT))
 pygame.display.set_caption("Flappy Bird")
 
 IMAGES, SOUNDS, HITMASKS = flappy_bird_utils.load()
+# column bit-packed hitmasks, an overlap test is a shift and an AND per column
+HITMASK_BITS = {key: tuple(flappy_bird_utils.packHitmask(mask) for mask in masks) for key, masks in HITMASKS.items()}
 PIPEGAPSIZE = 100  # gap between upper and lower part of pipe
 BASEY = SCREENHEIGHT * 0.79
 
@@ -194,22 +196,26 @@ def checkCrash(player, upperPipes, lowerPipes):
     if player["y"] + player["h"] >= BASEY - 1:
         return True
     else:
+        playerX, playerY = player["x"], int(player["y"])
 
-        playerRect = pygame.Rect(player["x"], player["y"], player["w"], player["h"])
+        # player and upper/lower pipe hitmasks
+        pBits = HITMASK_BITS["player"][pi]
+        uBits = HITMASK_BITS["pipe"][0]
+        lBits = HITMASK_BITS["pipe"][1]
 
         for uPipe, lPipe in zip(upperPipes, lowerPipes):
-            # upper and lower pipe rects
-            uPipeRect = pygame.Rect(uPipe["x"], uPipe["y"], PIPE_WIDTH, PIPE_HEIGHT)
-            lPipeRect = pygame.Rect(lPipe["x"], lPipe["y"], PIPE_WIDTH, PIPE_HEIGHT)
-
-            # player and upper/lower pipe hitmasks
-            pHitMask = HITMASKS["player"][pi]
-            uHitmask = HITMASKS["pipe"][0]
-            lHitmask = HITMASKS["pipe"][1]
-
-            # if bird collided with upipe or lpipe
-            uCollide = pixelCollision(playerRect, uPipeRect, pHitMask, uHitmask)
-            lCollide = pixelCollision(playerRect, lPipeRect, pHitMask, lHitmask)
+            # skip the pipe pair unless its columns overlap the player box
+            pipeX = int(uPipe["x"])
+            if pipeX >= playerX + player["w"] or pipeX + PIPE_WIDTH <= playerX:
+                continue
+
+            # if bird collided with upipe or lpipe, only tested when the boxes overlap
+            uCollide = playerY < uPipe["y"] + PIPE_HEIGHT and bitCollision(
+                playerX, playerY, pBits, pipeX, uPipe["y"], uBits
+            )
+            lCollide = playerY + player["h"] > lPipe["y"] and bitCollision(
+                playerX, playerY, pBits, pipeX, lPipe["y"], lBits
+            )
 
             if uCollide or lCollide:
                 return True
@@ -217,18 +223,19 @@ def checkCrash(player, upperPipes, lowerPipes):
     return False
 
 
-def pixelCollision(rect1, rect2, hitmask1, hitmask2):
-    """Checks if two objects collide and not just their rects"""
-    rect = rect1.clip(rect2)
-
-    if rect.width == 0 or rect.height == 0:
-        return False
+def bitCollision(x1, y1, bits1, x2, y2, bits2):
+    """Checks if two objects collide, using their column bit-packed hitmasks"""
+    left = max(x1, x2)
+    right = min(x1 + len(bits1), x2 + len(bits2))
 
-    x1, y1 = rect.x - rect1.x, rect.y - rect1.y
-    x2, y2 = rect.x - rect2.x, rect.y - rect2.y
-
-    for x in range(rect.width):
-        for y in range(rect.height):
-            if hitmask1[x1 + x][y1 + y] and hitmask2[x2 + x][y2 + y]:
+    # shift object 1 columns onto object 2 rows, bits past the column heights are 0
+    dy = y1 - y2
+    if dy >= 0:
+        for x in range(left, right):
+            if (bits1[x - x1] << dy) & bits2[x - x2]:
+                return True
+    else:
+        for x in range(left, right):
+            if bits1[x - x1] & (bits2[x - x2] << -dy):
                 return True
     return False
@@ -0,0 +1,269 @@
+"""
+Reproducible throughput benchmark of the Q-learning trainers.
+
+Every case plays the same number of games from a seeded pipe generator, starting from a fixed Q table
+(data/qvalues-trained.json unless --qvalues is given), so two runs of the same code play exactly the same
+games.
+A case is the simulator setup of one training script:
+
+- "learn.py": python backend, dict Q table, pixel collisions
+- "learn-opt.py": python backend, dense Q table, collision table
+- "learn-opt jit.py": numba backend, whole games compiled
+- "learn_vec.py": numpy backend, VEC_ENVS games stepped together
+
+One warm-up game (imports, table loading and JIT compilation) is played and reported separately, then
+the timed run reports frames/s, games/s and the mean time of Bot.update_scores, plus the score total and
+a Q table checksum to catch changes of the game semantics. The numpy case only counts the frames of the
+games finished within the run. Results are written as JSON; with --baseline
+the run is compared with a saved result and the exit status is 1 on a regression.
+
+With --startup the headless learn.py setups of STARTUP_CASES are also launched as fresh processes
+playing one game: start-up is the time from spawning the process to its first simulated frame (read
+from its --timings line), first_game adds the first game and the process exit.
+
+    python bench.py --output benchmark/baseline.json
+    python bench.py --baseline benchmark/baseline.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from bot import DATA_DIR, N_STATES, STATE_KEYS, Bot
+from flappy_sim import PipeStream, play_games
+from hitmask_cache import pixel_hitmasks
+
+CASES = {
+    "learn.py": {"backend": "python", "dense": False, "pixel": True},
+    "learn-opt.py": {"backend": "python", "dense": True, "pixel": False},
+    "learn-opt jit.py": {"backend": "numba", "dense": True, "pixel": False},
+    "learn_vec.py": {"backend": "numpy", "dense": True, "pixel": False},
+}
+STARTUP_CASES = {
+    "learn.py": [],
+    "learn.py --dense --lut": ["--dense", "--lut"],
+    "learn.py --backend numba": ["--backend", "numba"],
+}
+VEC_ENVS = 256
+START_QVALUES = DATA_DIR / "qvalues-trained.json"
+
+
+def start_qvalues(path=START_QVALUES):
+    """The fixed starting Q table, the JSON table as a dense array"""
+    qvalues = np.zeros((N_STATES, 2))
+    with open(path, "r") as fil:
+        table = json.load(fil)
+    for i, key in enumerate(STATE_KEYS):
+        if key in table:
+            qvalues[i] = table[key]
+    return qvalues
+
+
+def make_bot(dense, qvalues):
+    """A bot acting on a private copy of qvalues, never loading or dumping the data files"""
+    bot = Bot(qvalues=qvalues.copy())
+    if not dense:
+        bot.dense = False
+        bot.last_state = STATE_KEYS[bot.last_state]
+        bot.qvalues = dict(zip(STATE_KEYS, qvalues.tolist()))
+
+    # count the frames and time every update
+    bot.frames = 0
+    bot.update_ns = 0
+    update_scores = bot.update_scores
+
+    def timed_update_scores(dump_qvalues=True, moves=None, truncated=False):
+        if moves is not None:
+            bot.frames += len(moves[0])
+        else:
+            bot.frames += bot.hist_len if bot.dense else len(bot.moves)
+        start = time.perf_counter_ns()
+        update_scores(dump_qvalues=False, moves=moves, truncated=truncated)
+        bot.update_ns += time.perf_counter_ns() - start
+
+    bot.update_scores = timed_update_scores
+    return bot
+
+
+def checksum(bot):
+    """Sum of the Q table, identical between runs playing the same games"""
+    if bot.dense:
+        return float(bot.qvalues.sum())
+    return float(sum(sum(values) for values in bot.qvalues.values()))
+
+
+def run_case(case, games, seed, qvalues, hitmasks):
+    """Plays the warm-up game and the timed games of one case, returns its result dict"""
+    setup = CASES[case]
+    caseHitmasks = hitmasks if setup["pixel"] else None
+
+    start = time.perf_counter()
+    warmBot = make_bot(setup["dense"], qvalues)
+    list(play_games(warmBot, 1, setup["backend"], PipeStream(seed), VEC_ENVS, caseHitmasks))
+    warmup = time.perf_counter() - start
+
+    bot = make_bot(setup["dense"], qvalues)
+    start = time.perf_counter()
+    scores = list(play_games(bot, games, setup["backend"], PipeStream(seed), VEC_ENVS, caseHitmasks))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "warmup_s": warmup,
+        "elapsed_s": elapsed,
+        "games": len(scores),
+        "frames": bot.frames,
+        "games_per_s": len(scores) / elapsed,
+        "frames_per_s": bot.frames / elapsed,
+        "update_scores_us": bot.update_ns / len(scores) / 1e3,
+        "score_total": int(sum(scores)),
+        "score_max": int(max(scores)),
+        "qvalues_checksum": checksum(bot),
+    }
+
+
+def run_startup(case, seed):
+    """Launches learn.py for one game in a fresh process, returns its start-up and first game times"""
+    script = Path(__file__).resolve().parent / "learn.py"
+    with tempfile.TemporaryDirectory() as tmp:
+        timings = Path(tmp) / "timings.jsonl"
+        command = [sys.executable, str(script), "--iter", "1", "--seed", str(seed), "--no-dump"]
+        command += STARTUP_CASES[case] + ["--timings", str(timings)]
+        spawned = time.time()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        exited = time.time()
+        with open(timings, "r") as fd:
+            line = json.loads(fd.readlines()[-1])
+    return {"startup_s": line["first_frame_time"] - spawned, "first_game_s": exited - spawned}
+
+
+def run(cases, games, seed, repeat=1, qvalues_path=START_QVALUES, startup=False):
+    """Runs the cases, keeping the fastest of `repeat` runs of each, returns the JSON-able results"""
+    qvalues = start_qvalues(qvalues_path)
+    hitmasks = pixel_hitmasks()
+
+    results = {}
+    for case in cases:
+        runs = [run_case(case, games, seed, qvalues, hitmasks) for _ in range(repeat)]
+        results[case] = min(runs, key=lambda result: result["elapsed_s"])
+        logging.info(
+            f"{case}: {results[case]['games_per_s']:.1f} games/s, {results[case]['frames_per_s']:.0f} frames/s"
+        )
+
+    startups = {}
+    if startup:
+        for case in STARTUP_CASES:
+            runs = [run_startup(case, seed) for _ in range(repeat)]
+            startups[case] = min(runs, key=lambda result: result["startup_s"])
+            logging.info(f"{case}: start-up {startups[case]['startup_s'] * 1e3:.0f} ms")
+
+    return {
+        "meta": {
+            "games": games,
+            "seed": seed,
+            "repeat": repeat,
+            "qvalues": Path(qvalues_path).name,
+            "qvalues_sha256": hashlib.sha256(qvalues.tobytes()).hexdigest(),
+            "vec_envs": VEC_ENVS,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+        "startup": startups,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """
+    Compares two benchmark results, returns the report lines and True if a case got slower than the
+    baseline by more than `tolerance` (a fraction) or played different games
+    """
+    lines, regressed = [], False
+    for key in ("games", "seed", "qvalues_sha256", "vec_envs"):
+        if current["meta"][key] != baseline["meta"][key]:
+            raise ValueError(f"Baseline was run with {key}={baseline['meta'][key]}, not {current['meta'][key]}")
+
+    for case, result in current["results"].items():
+        base = baseline["results"].get(case)
+        if base is None:
+            lines.append(f"{case}: not in baseline")
+            continue
+
+        speedup = result["games_per_s"] / base["games_per_s"]
+        status = "ok"
+        if speedup < 1 - tolerance:
+            status, regressed = "REGRESSION", True
+        if result["score_total"] != base["score_total"] or result["qvalues_checksum"] != base["qvalues_checksum"]:
+            status, regressed = "DIFFERENT GAMES", True
+        lines.append(
+            f"{case}: {speedup:.2f}x games/s, update_scores {result['update_scores_us']:.1f} us"
+            f" (baseline {base['update_scores_us']:.1f} us), warm-up {result['warmup_s']:.2f} s"
+            f" (baseline {base['warmup_s']:.2f} s) - {status}"
+        )
+
+    for case, result in current.get("startup", {}).items():
+        base = baseline.get("startup", {}).get(case)
+        if base is None:
+            lines.append(f"{case} start-up: not in baseline")
+            continue
+
+        status = "ok"
+        if result["startup_s"] > base["startup_s"] * (1 + tolerance):
+            status, regressed = "REGRESSION", True
+        lines.append(
+            f"{case} start-up: {result['startup_s'] * 1e3:.0f} ms (baseline {base['startup_s'] * 1e3:.0f} ms),"
+            f" first game {result['first_game_s']:.2f} s (baseline {base['first_game_s']:.2f} s) - {status}"
+        )
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser("bench.py")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES), help="cases to run")
+    parser.add_argument("--games", type=int, default=100, help="number of timed games per case")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the pipe generator")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest one is kept")
+    parser.add_argument("--qvalues", type=Path, default=START_QVALUES, help="JSON Q table to start from")
+    parser.add_argument("--startup", action="store_true", help="also measure the start-up of fresh trainers")
+    parser.add_argument("--output", type=Path, default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", type=Path, default=None, help="compare with this saved result")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    results = run(args.cases, args.games, args.seed, args.repeat, args.qvalues, args.startup)
+
+    if args.output is not None:
+        with open(args.output, "w") as fd:
+            json.dump(results, fd, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as fd:
+            baseline = json.load(fd)
+        try:
+            lines, regressed = compare(results, baseline, args.tolerance)
+        except ValueError as e:
+            parser.error(str(e))
+        print("\n".join(lines))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
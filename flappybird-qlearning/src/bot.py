@@ -1,9 +1,26 @@
 import json
 import logging
 from pathlib import Path
+from time import perf_counter_ns
+
+import numpy as np
+from checkpoint import CheckpointWriter
+from discretization import Discretization
+from phase_counters import COUNTERS
+from qvalues_io import append_deltas, load_table, new_log_id, save_qvalues, start_delta_log
 
 logging.basicConfig(level=logging.DEBUG)
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+QVALUES_BIN = DATA_DIR / "qvalues.bin"  # binary table of the dense mode
+QVALUES_LOG = DATA_DIR / "qvalues.delta"  # rows changed since the last qvalues.bin snapshot
+
+# Default grid of the discretized state space, see discretization.py
+STATES = Discretization()
+N_STATES = STATES.n_states
+GRID = STATES.grid
+STATE_KEYS = STATES.keys  # state keys in state index order
+
+HISTORY_CAPACITY = 1024  # initial length of the dense history arrays, doubled when full
 
 
 class Bot(object):
@@ -11,63 +28,237 @@ class Bot(object):
     The Bot class that applies the Qlearning logic to Flappy bird game
     After every iteration (iteration = 1 game that ends with the bird dying) updates Q values
     After every DUMPING_N iterations, dumps the Q values to the local JSON file
+
+    With dense=True the states are integer indices and the Q values are kept in a
+    contiguous (N_STATES, 2) float array instead of a dict keyed by "x_y_v" strings.
+    The dense table is stored in the binary qvalues.bin. Both modes load the most recently written of
+    qvalues.json and qvalues.bin, so the two files never shadow each other's training.
+    A dense bot can also be given an existing array (e.g. a shared-memory table) as qvalues,
+    it then uses that array in place instead of loading the Q values from file.
+    In dense mode the history is kept in growable integer arrays and replayed by a compiled kernel.
+    With async_dump=True the dumps are written by a background CheckpointWriter, call close() when done.
+    lr, discount, rewards ((alive, death) rewards) and dumping_n are the learning hyperparameters,
+    see sweep.py to compare them. spec is the state discretization (see discretization.py), the default
+    grid if None. replay is a ReplayStore (see replay.py) of the dense mode: after every game, sampled
+    past games are replayed through the same backward update.
+    With compact_every=k (dense mode), the bot tracks the rows it changed in a boolean dirty array and a
+    dump appends only these rows to the delta log qvalues.delta (see qvalues_io.py). Every k-th dump, and
+    whenever the log would outgrow the table, the table is compacted into a full qvalues.bin snapshot.
+    refine(spec) moves the bot to another (finer) grid between two games, see learn.py --refine-at.
+    With learning=False the bot only acts greedily (see evaluate.py): no history is recorded, and
+    update_scores counts the game without updating or dumping the Q values.
     """
 
-    def __init__(self):
-        self.gameCNT = 0  # Game count of current run, incremented after every death
-        self.DUMPING_N = 25  # Number of iterations to dump Q values to JSON after
-        self.discount = 1.0
-        self.r = {0: 1, 1: -1000}  # Reward function
-        self.lr = 0.7
-        self.load_qvalues()
-        self.last_state = "420_240_0"
+    def __init__(
+        self,
+        dense=False,
+        qvalues=None,
+        async_dump=False,
+        lr=0.7,
+        discount=1.0,
+        rewards=(1, -1000),
+        dumping_n=25,
+        spec=None,
+        replay=None,
+        compact_every=None,
+        learning=True,
+    ):
+        self.dense = dense or qvalues is not None
+        if replay is not None and not self.dense:
+            raise ValueError("Experience replay needs a Bot(dense=True)")
+        self.states = STATES if spec is None else Discretization(spec)
+        self.gameCNT = 0  # Game count of current run, incremented after every death (or truncated game)
+        self.truncatedCNT = 0  # Games of gameCNT cut at a frame or score cap instead of a death
+        self.DUMPING_N = dumping_n  # Number of iterations to dump Q values to JSON after
+        self.discount = discount
+        self.r = {0: rewards[0], 1: rewards[1]}  # Reward function
+        self.lr = lr
+        self.learning = learning
+        if qvalues is not None:
+            self.qvalues = qvalues
+        else:
+            self.load_qvalues()
+        self.last_state = self.states.index(420, 240, 0)
+        if not self.dense:
+            self.last_state = self.states.keys[self.last_state]
         self.last_action = 0
-        self.moves = []
+        self.moves = []  # (state, action, next state) history of the dict mode
+        self.hist_states = np.empty(HISTORY_CAPACITY, dtype=np.int32)  # history of the dense mode
+        self.hist_actions = np.empty(HISTORY_CAPACITY, dtype=np.int8)
+        self.hist_next = np.empty(HISTORY_CAPACITY, dtype=np.int32)
+        self.hist_len = 0
+        self.writer = CheckpointWriter() if async_dump else None
+        self.replay = replay
+        self.compact_every = compact_every
+        # rows changed since the last dump, None if not tracked (full snapshots only)
+        self.dirty = np.zeros(self.states.n_states, dtype=bool) if self.dense and compact_every else None
+        self.log_id = None  # delta log of the last snapshot written, None before the first one
+        self.log_dumps = self.log_rows = 0  # delta dumps and rows appended since that snapshot
 
     def load_qvalues(self):
         """
-        Load q values from a JSON file
+        Load q values from the most recently written of the JSON file (dict mode) and the binary file
+        with its delta log (dense mode), whatever the mode of this bot, so a table trained in one mode
+        is played and trained further in the other. A table of another grid is projected onto this
+        bot's grid (see qvalues_io.load_table).
         """
-        self.qvalues = {}
-        try:
-            fil = open(f"{DATA_DIR}/qvalues.json", "r")
-        except IOError:
+        json_path = DATA_DIR / "qvalues.json"
+        json_time = json_path.stat().st_mtime if json_path.exists() else None
+        bin_time = None
+        if QVALUES_BIN.exists():
+            bin_time = max(path.stat().st_mtime for path in (QVALUES_BIN, QVALUES_LOG) if path.exists())
+
+        if json_time is None and bin_time is None:
+            self.qvalues = np.zeros((self.states.n_states, 2)) if self.dense else {}
             return
-        self.qvalues = json.load(fil)
-        fil.close()
+        if bin_time is not None and (json_time is None or bin_time >= json_time):
+            path, older = QVALUES_BIN, json_path if json_time is not None else None
+        else:
+            path, older = json_path, QVALUES_BIN if bin_time is not None else None
+        if older is not None:
+            logging.warning(f"Loading {path.name}, {older.name} is older and may differ")
+
+        qvalues = load_table(path, self.states.spec)
+        self.qvalues = qvalues if self.dense else dict(zip(self.states.keys, qvalues.tolist()))
 
     def act(self, xdif, ydif, vel):
         """
         Chooses the best action with respect to the current state - Chooses 0 (don't flap) to tie-break
         """
-        state = self.map_state(xdif, ydif, vel)
-
-        self.moves.append((self.last_state, self.last_action, state))  # Add the experience to the history
+        # Add the experience to the history (not when only evaluating)
+        if not self.learning:
+            state = self.map_state_index(xdif, ydif, vel) if self.dense else self.map_state(xdif, ydif, vel)
+        elif self.dense:
+            state = self.map_state_index(xdif, ydif, vel)
+            n = self.hist_len
+            if n == len(self.hist_states):
+                self.grow_history()
+            self.hist_states[n] = self.last_state
+            self.hist_actions[n] = self.last_action
+            self.hist_next[n] = state
+            self.hist_len = n + 1
+        else:
+            state = self.map_state(xdif, ydif, vel)
+            self.moves.append((self.last_state, self.last_action, state))
 
         self.last_state = state  # Update the last_state with the current state
 
         # 缓存局部变量，减少多次字典访问
-        q0, q1 = self.qvalues[state]
+        if self.dense:
+            q0, q1 = self.qvalues.item(state, 0), self.qvalues.item(state, 1)
+        else:
+            q0, q1 = self.qvalues[state]
         action = 0 if q0 >= q1 else 1
         self.last_action = action
 
         return action
 
-    def update_scores(self, dump_qvalues=True):
+    def grow_history(self):
+        """
+        Double the capacity of the dense history arrays
+        """
+        self.hist_states = np.concatenate((self.hist_states, np.empty_like(self.hist_states)))
+        self.hist_actions = np.concatenate((self.hist_actions, np.empty_like(self.hist_actions)))
+        self.hist_next = np.concatenate((self.hist_next, np.empty_like(self.hist_next)))
+
+    def update_scores(self, dump_qvalues=True, moves=None, truncated=False):
+        """
+        Update qvalues via iterating over experiences.
+        In dense mode, moves can be a (states, actions, next states) tuple of arrays played elsewhere
+        (e.g. by a compiled episode), used instead of the recorded history.
+        truncated is True when the game was cut at a frame or score cap: the bird did not die, so every
+        experience gets the alive reward.
+        """
+        start = perf_counter_ns()
+        if not self.learning:
+            dump_qvalues = False
+        elif self.dense:
+            if moves is None:
+                n = self.hist_len
+                moves = (self.hist_states[:n], self.hist_actions[:n], self.hist_next[:n])
+            self.update_dense(*moves, truncated=truncated)
+        else:
+            self.update_dict(truncated)
+        COUNTERS.add("update_scores", perf_counter_ns() - start)
+
+        self.gameCNT += 1  # increase game count
+        self.truncatedCNT += truncated
+        if dump_qvalues:
+            self.dump_qvalues()  # Dump q values (if game count % DUMPING_N == 0)
+        self.moves = []  # clear history after updating strategies
+        self.hist_len = 0
+        COUNTERS.game_done(truncated)
+
+    def update_dense(self, states, actions, next_states, truncated=False):
+        """
+        Backward Q update of the dense mode, compiled
+        """
+        from update_jit import backward_update  # numba is only needed by the dense mode
+
+        if truncated:
+            # no death: the alive reward everywhere, not replayed (the replay punishes the last moves)
+            backward_update(
+                self.qvalues, states, actions, next_states, self.lr, self.discount, self.r[0], self.r[0], False
+            )
+            self.mark_dirty(states)
+            return
+
+        # Flag if the bird died in the top pipe
+        high_death_flag = self.states.y_value(int(next_states[-1])) > 120
+        backward_update(
+            self.qvalues, states, actions, next_states, self.lr, self.discount, self.r[0], self.r[1], high_death_flag
+        )
+        self.mark_dirty(states)
+        if self.replay is not None:
+            self.replay_games()
+            self.replay.add(states, actions, next_states, high_death_flag)
+
+    def replay_games(self):
         """
-        Update qvalues via iterating over experiences
+        Replays sampled past games of the replay store through the backward update, part of update_scores
         """
-        history = list(reversed(self.moves))
+        from update_jit import backward_update
+
+        start = perf_counter_ns()
+        moves = 0
+        for states, actions, next_states, high_death_flag in self.replay.sample():
+            backward_update(
+                self.qvalues,
+                states,
+                actions,
+                next_states,
+                self.replay.lr,
+                self.discount,
+                self.r[0],
+                self.r[1],
+                high_death_flag,
+            )
+            self.mark_dirty(states)
+            moves += len(states)
+        COUNTERS.add("replay", perf_counter_ns() - start, moves)
+
+    def mark_dirty(self, states):
+        """
+        Flag the updated rows for the next delta dump, after the update (another process may be dumping)
+        """
+        if self.dirty is not None:
+            self.dirty[states] = True
+
+    def update_dict(self, truncated=False):
+        """
+        Backward Q update of the dict mode, without the death penalty if truncated
+        """
+        history = reversed(self.moves)
 
         # 缓存局部变量
         qvalues = self.qvalues
         lr = self.lr
         discount = self.discount
         r0 = self.r[0]
-        r1 = self.r[1]
+        r1 = r0 if truncated else self.r[1]
 
         # Flag if the bird died in the top pipe
-        high_death_flag = True if int(history[0][2].split("_")[1]) > 120 else False
+        high_death_flag = not truncated and int(self.moves[-1][2].split("_")[1]) > 120
 
         # Q-learning score updates
         t = 1
@@ -88,38 +279,117 @@ class Bot(object):
 
             t += 1
 
-        self.gameCNT += 1  # increase game count
-        if dump_qvalues:
-            self.dump_qvalues()  # Dump q values (if game count % DUMPING_N == 0)
-        self.moves = []  # clear history after updating strategies
+    def refine(self, spec):
+        """
+        Switch to the discretization spec between two games (coarse-to-fine transfer): the new Q table
+        is projected from the current one through the bins, see Discretization.project
+        """
+        states = Discretization(spec)
+        if self.dense:
+            self.qvalues = self.states.project(self.qvalues, states)
+        else:
+            qvalues = np.array([self.qvalues.get(key, [0, 0]) for key in self.states.keys], dtype=np.float64)
+            self.qvalues = dict(zip(states.keys, self.states.project(qvalues, states).tolist()))
+        self.states = states
+        self.last_state = states.index(420, 240, 0)
+        if not self.dense:
+            self.last_state = states.keys[self.last_state]
+        if self.dirty is not None:
+            self.dirty = np.zeros(states.n_states, dtype=bool)
+            self.log_id = None  # the next dump is a full snapshot of the new grid
+        if self.replay is not None:
+            self.replay.clear()
 
     def map_state(self, xdif, ydif, vel):
         """
-        Map the (xdif, ydif, vel) to a grid state.
-        Optimized: 使用局部变量缓存整型转换结果，减少重复计算。
+        Map the (xdif, ydif, vel) to the key of its grid state.
+        States outside the grid are clamped to the border bins.
         """
-        xdif = int(xdif)
-        ydif = int(ydif)
-
-        # 根据不同范围设置不同的网格步长
-        if xdif < 140:
-            xdif -= xdif % 10
-        else:
-            xdif -= xdif % 70
+        return self.states.keys[self.states.index(xdif, ydif, vel)]
 
-        if ydif < 180:
-            ydif -= ydif % 10
-        else:
-            ydif -= ydif % 60
+    def map_state_index(self, xdif, ydif, vel):
+        """
+        Map the (xdif, ydif, vel) to the index of its grid state, used in dense mode.
+        """
+        return self.states.index(xdif, ydif, vel)
 
-        return f"{xdif}_{ydif}_{vel}"
+    def map_state_indices(self, xdif, ydif, vel):
+        """
+        Vectorized map_state_index over NumPy arrays of (xdif, ydif, vel), used by the batch trainer
+        """
+        return self.states.indices(xdif, ydif, vel)
 
     def dump_qvalues(self, force=False):
         """
-        Dump the qvalues to the JSON file
+        Dump the qvalues to the JSON file (atomically to the binary file in dense mode),
+        on the writer thread if the bot has one
         """
         if self.gameCNT % self.DUMPING_N == 0 or force:
+            start = perf_counter_ns()
+            if self.dirty is not None:
+                snapshot, write = self.snapshot_checkpoint, self.write_checkpoint
+            else:
+                snapshot, write = self.snapshot_qvalues, self.write_qvalues
+            if self.writer is not None:
+                self.writer.submit(snapshot, write)
+            elif self.dirty is not None:
+                write(snapshot())
+            else:
+                self.write_qvalues(self.qvalues)
+            COUNTERS.add("dump_qvalues", perf_counter_ns() - start)
+
+    def snapshot_qvalues(self):
+        """
+        Copy of the qvalues that training can no longer modify
+        """
+        if self.dense:
+            return self.qvalues.copy()
+        return {state: list(values) for state, values in self.qvalues.items()}
+
+    def snapshot_checkpoint(self):
+        """
+        The rows changed since the last dump as (None, (indices, rows)), or (log_id, full copy) when the
+        table is due for compaction into a new snapshot. Clears the dirty flags before copying the rows.
+        """
+        indices = np.flatnonzero(self.dirty)
+        self.dirty[indices] = False
+        compact = self.log_id is None or self.log_dumps >= self.compact_every - 1
+        if compact or self.log_rows + len(indices) > len(self.dirty):
+            self.log_id = new_log_id()
+            self.log_dumps = self.log_rows = 0
+            return self.log_id, self.qvalues.copy()
+
+        self.log_dumps += 1
+        self.log_rows += len(indices)
+        return None, (indices, self.qvalues[indices])
+
+    def write_checkpoint(self, checkpoint):
+        """
+        Write a snapshot_checkpoint: a full snapshot with a new empty delta log, or delta records
+        """
+        log_id, data = checkpoint
+        if log_id is not None:
+            save_qvalues(QVALUES_BIN, data, self.states.grid, log_id)
+            start_delta_log(QVALUES_LOG, log_id)
+        else:
+            append_deltas(QVALUES_LOG, *data)
+        logging.debug("Q-values updated on local file.")
+
+    def write_qvalues(self, qvalues):
+        """
+        Write the given qvalues to the local file
+        """
+        if self.dense:
+            save_qvalues(QVALUES_BIN, qvalues, self.states.grid)
+        else:
             fil = open(f"{DATA_DIR}/qvalues.json", "w")
-            json.dump(self.qvalues, fil)
+            json.dump(qvalues, fil)
             fil.close()
-            logging.debug("Q-values updated on local file.")
+        logging.debug("Q-values updated on local file.")
+
+    def close(self):
+        """
+        Wait for the pending background dumps
+        """
+        if self.writer is not None:
+            self.writer.close()
@@ -0,0 +1,88 @@
+"""
+Background checkpoint writer.
+
+The training thread only takes a snapshot of the Q values (an array or dict copy) and hands it to a
+writer thread through a bounded queue, the serialization and the disk write happen off the training
+thread. When `depth` checkpoints are already pending, submit blocks until one is written, so memory
+stays bounded. The time the training thread spends in submit (snapshot + waiting for a queue slot) is
+recorded as the dump stall.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+
+
+class CheckpointWriter(object):
+    """
+    Writes checkpoints on a daemon thread, at most `depth` snapshots wait in the queue.
+    Call close() (also registered with atexit) to write the pending checkpoints and log the metrics.
+    """
+
+    def __init__(self, depth=2):
+        self.queue = queue.Queue(maxsize=depth)
+        self.error = None
+        self.closed = False
+        self.metrics = {
+            "dumps": 0,  # checkpoints submitted
+            "written": 0,  # checkpoints written to disk
+            "blocked": 0,  # submits that found the queue full
+            "stall_s": 0.0,  # total time the training thread spent in submit
+            "max_stall_s": 0.0,
+            "write_s": 0.0,  # total time the writer thread spent writing
+            "max_write_s": 0.0,
+        }
+        self.thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, snapshot, write):
+        """Takes snapshot() on the calling thread and queues write(snapshot) for the writer thread"""
+        if self.closed:
+            raise RuntimeError("submit on a closed CheckpointWriter")
+
+        start = time.perf_counter()
+        data = snapshot()
+        if self.queue.full():
+            self.metrics["blocked"] += 1
+        self.queue.put((write, data))
+        stall = time.perf_counter() - start
+
+        self.metrics["dumps"] += 1
+        self.metrics["stall_s"] += stall
+        self.metrics["max_stall_s"] = max(self.metrics["max_stall_s"], stall)
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+
+            write, data = job
+            start = time.perf_counter()
+            try:
+                write(data)
+            except Exception as e:
+                logging.exception("Checkpoint write failed")
+                self.error = e
+            else:
+                elapsed = time.perf_counter() - start
+                self.metrics["written"] += 1
+                self.metrics["write_s"] += elapsed
+                self.metrics["max_write_s"] = max(self.metrics["max_write_s"], elapsed)
+
+    def close(self):
+        """Waits for the pending checkpoints, logs the metrics and re-raises the last write error"""
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+
+        self.queue.put(None)
+        self.thread.join()
+        logging.info("Checkpoint metrics: " + ", ".join(f"{k}={v:.4g}" for k, v in self.metrics.items()))
+
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,95 @@
+"""
+Precomputed pixel collision between the player and the pipes.
+
+The player x is fixed and there are only 3 player and 2 pipe hitmasks, so pixel collision is a pure
+function of (player frame, pipe, dx, dy). The whole table is built once from the sprite hitmasks
+(hitmask_cache.py) and cached bit-packed; the cache is rebuilt whenever the hitmasks change.
+"""
+
+import hashlib
+import io
+import logging
+import zipfile
+from pathlib import Path
+
+import numpy as np
+from hitmask_cache import load_hitmasks
+from qvalues_io import write_atomic
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+CACHE_PATH = DATA_DIR / "collision_table.npz"
+
+
+class CollisionTable(object):
+    """
+    table[f, p, dx + player_w - 1, dy + player_h - 1] is True if player frame f collides with pipe p
+    (0 = upper, 1 = lower) when dx = player x - pipe x and dy = player y - pipe y.
+    Relative positions outside the table do not overlap at all.
+    """
+
+    __slots__ = ("table", "x0", "y0", "nx", "ny")
+
+    def __init__(self, table, player_size):
+        self.table = table
+        self.x0 = player_size[0] - 1
+        self.y0 = player_size[1] - 1
+        self.nx, self.ny = table.shape[2:]
+
+    def collides(self, player_index, pipe_index, dx, dy):
+        """returns True if the player collides with the pipe at the relative position (dx, dy)"""
+        i = dx + self.x0
+        j = dy + self.y0
+        return 0 <= i < self.nx and 0 <= j < self.ny and bool(self.table[player_index, pipe_index, i, j])
+
+
+def build_table(player_masks, pipe_masks):
+    """Compute the collision table by correlating every overlapping pair of mask columns"""
+    playerW, playerH = player_masks[0].shape
+    pipeW, pipeH = pipe_masks[0].shape
+    table = np.zeros((len(player_masks), len(pipe_masks), playerW + pipeW - 1, playerH + pipeH - 1), dtype=bool)
+
+    for f, pMask in enumerate(player_masks):
+        pMask = pMask.astype(np.int64)
+        for p, tMask in enumerate(pipe_masks):
+            tMask = tMask.astype(np.int64)
+            for dx in range(-playerW + 1, pipeW):
+                # overlapping columns, pipe column = player column + dx
+                hits = np.zeros(playerH + pipeH - 1, dtype=np.int64)
+                for col in range(max(0, -dx), min(playerW, pipeW - dx)):
+                    hits += np.correlate(tMask[col + dx], pMask[col], "full")
+                table[f, p, dx + playerW - 1] = hits > 0
+    return table
+
+
+def write_cache(cache_path, digest, table):
+    """Atomically replaces the cache file with the table built from the hitmasks of the digest"""
+    data = io.BytesIO()
+    np.savez_compressed(data, digest=digest, shape=table.shape, bits=np.packbits(table, axis=None))
+    write_atomic(cache_path, (data.getbuffer(),))
+
+
+def load_table(cache_path=CACHE_PATH):
+    """
+    Returns the CollisionTable of the sprite hitmasks, read from the cache when it was built from the
+    same hitmasks (by content hash), otherwise rebuilt and cached
+    """
+    player_masks, pipe_masks = load_hitmasks()
+    digest = hashlib.sha256()
+    for mask in player_masks + pipe_masks:
+        digest.update(np.array(mask.shape).tobytes())
+        digest.update(np.packbits(mask, axis=None).tobytes())
+    digest = digest.hexdigest()
+
+    try:
+        with np.load(cache_path) as cache:
+            if str(cache["digest"]) == digest:
+                shape = tuple(cache["shape"])
+                table = np.unpackbits(cache["bits"], count=int(np.prod(shape))).astype(bool).reshape(shape)
+                return CollisionTable(table, player_masks[0].shape)
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        pass  # missing, stale or partially written cache
+
+    table = build_table(player_masks, pipe_masks)
+    write_cache(cache_path, digest, table)
+    logging.debug("Collision table rebuilt and cached.")
+    return CollisionTable(table, player_masks[0].shape)
@@ -0,0 +1,81 @@
+"""
+State discretization of the Q-learning bot, shared by the bot, the trainers and initialize_qvalues.py.
+
+A spec gives, for each distance axis, the bin lower edges as (start, stop, step) segments, and the
+velocity range:
+
+    {"x": [[-40, 140, 10], [140, 421, 70]], "y": [[-300, 180, 10], [180, 421, 60]], "v": [-10, 10]}
+
+Distances below the first edge fall in the first bin, distances at or above the last edge in the last
+one, velocities are clamped to the range. The state index is (xi * N_Y + yi) * N_V + vi, and the state
+key "x_y_v" is built from the lower edges. Discretization compiles the spec once into integer lookup
+arrays over the bounded raw xdif, ydif and velocity ranges, already scaled to their part of the index,
+so mapping a state is a sum of array reads: x_lut[xdif + RAW_LIMIT] + y_lut[ydif + RAW_LIMIT] +
+v_lut[vel + VEL_LIMIT].
+"""
+
+import numpy as np
+
+RAW_LIMIT = 1024  # |xdif| and |ydif| are below it in any game, the screen is 288x512
+VEL_LIMIT = 64  # |vel| is below it in any game
+
+# the grid of the original bot (10 px bins near the pipe), and the finer 5 px grid of the README update
+SPECS = {
+    "10px": {"x": [[-40, 140, 10], [140, 421, 70]], "y": [[-300, 180, 10], [180, 421, 60]], "v": [-10, 10]},
+    "5px": {"x": [[-40, 140, 5], [140, 421, 70]], "y": [[-300, 180, 5], [180, 421, 60]], "v": [-10, 10]},
+}
+DEFAULT_SPEC = SPECS["10px"]
+
+
+def bin_edges(segments):
+    """Lower edges of the bins of an axis"""
+    return [edge for start, stop, step in segments for edge in range(start, stop, step)]
+
+
+class Discretization(object):
+    """The compiled spec: grid values, state keys and lookup arrays"""
+
+    def __init__(self, spec=DEFAULT_SPEC):
+        self.spec = spec
+        self.x_values = bin_edges(spec["x"])
+        self.y_values = bin_edges(spec["y"])
+        self.v_values = list(range(spec["v"][0], spec["v"][1] + 1))
+        self.n_x, self.n_y, self.n_v = len(self.x_values), len(self.y_values), len(self.v_values)
+        self.n_states = self.n_x * self.n_y * self.n_v
+        self.grid = {"x_values": self.x_values, "y_values": self.y_values, "v_values": self.v_values}
+        # state keys in state index order
+        self.keys = [f"{x}_{y}_{v}" for x in self.x_values for y in self.y_values for v in self.v_values]
+
+        raw = np.arange(-RAW_LIMIT, RAW_LIMIT)
+        xi = np.clip(np.searchsorted(self.x_values, raw, "right") - 1, 0, self.n_x - 1)
+        yi = np.clip(np.searchsorted(self.y_values, raw, "right") - 1, 0, self.n_y - 1)
+        vi = np.clip(np.arange(-VEL_LIMIT, VEL_LIMIT) - self.v_values[0], 0, self.n_v - 1)
+        self.x_lut = xi * (self.n_y * self.n_v)
+        self.y_lut = yi * self.n_v
+        self.v_lut = vi
+        self.luts = (self.x_lut, self.y_lut, self.v_lut)  # arguments of episode_jit.play_episode
+        # lists are faster to index one value at a time
+        self.x_list, self.y_list, self.v_list = self.x_lut.tolist(), self.y_lut.tolist(), self.v_lut.tolist()
+
+    def index(self, xdif, ydif, vel):
+        """Index of the state of (xdif, ydif, vel)"""
+        return self.x_list[int(xdif) + RAW_LIMIT] + self.y_list[int(ydif) + RAW_LIMIT] + self.v_list[vel + VEL_LIMIT]
+
+    def indices(self, xdif, ydif, vel):
+        """Vectorized index over NumPy arrays of (xdif, ydif, vel)"""
+        xdif = np.trunc(xdif).astype(np.int64)  # same truncation as int()
+        ydif = np.trunc(ydif).astype(np.int64)
+        vel = np.asarray(vel, dtype=np.int64)
+        return self.x_lut[xdif + RAW_LIMIT] + self.y_lut[ydif + RAW_LIMIT] + self.v_lut[vel + VEL_LIMIT]
+
+    def y_value(self, index):
+        """Lower y edge of the state index"""
+        return self.y_values[(index // self.n_v) % self.n_y]
+
+    def project(self, qvalues, target):
+        """
+        The (target.n_states, 2) table of the Discretization target initialized from the (n_states, 2)
+        qvalues of this one: every target state takes the values of the state containing its lower edges
+        """
+        x, y, v = np.meshgrid(target.x_values, target.y_values, target.v_values, indexing="ij")
+        return np.asarray(qvalues)[self.indices(x.ravel(), y.ravel(), v.ravel())].copy()
@@ -0,0 +1,204 @@
+"""
+Numba-compiled headless episode of the Q-learning simulator.
+
+play_episode runs a whole game of flappy_sim.FlappySim in nopython mode: pipe selection, greedy action
+selection on the dense Q table, crash check, scoring, physics, pipe spawning and history recording. Pipes
+are drawn from the splitmix64 sequence of flappy_sim.PipeStream, its state lives in a uint64 array.
+"""
+
+import numba as nb
+import numpy as np
+from discretization import RAW_LIMIT, VEL_LIMIT
+from flappy_sim import (
+    BASEY,
+    GAP_LOW,
+    GAP_RANGE,
+    PIPE_H,
+    PIPE_VEL_X,
+    PIPE_W,
+    PIPEGAPSIZE,
+    PLAYER_ACC_Y,
+    PLAYER_FLAP_ACC,
+    PLAYER_H,
+    PLAYER_INDEX_CYCLE,
+    PLAYER_MAX_VEL_Y,
+    PLAYER_MID,
+    PLAYERX,
+    SCREENWIDTH,
+)
+
+INDEX_CYCLE = np.array(PLAYER_INDEX_CYCLE)
+
+
+def new_rng_state(seed):
+    """Returns the generator state array for play_episode"""
+    return np.array([seed], dtype=np.uint64)
+
+
+@nb.njit(cache=True)
+def next_random(rng_state):
+    """splitmix64 step, advances rng_state in place"""
+    rng_state[0] += np.uint64(0x9E3779B97F4A7C15)
+    z = rng_state[0]
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+@nb.njit(cache=True)
+def random_gap(rng_state):
+    """y of the gap between upper and lower pipe, same range as getRandomPipe"""
+    return GAP_LOW + np.int64(next_random(rng_state) % np.uint64(GAP_RANGE))
+
+
+@nb.njit(cache=True)
+def map_state_index(x_lut, y_lut, v_lut, xdif, ydif, vel):
+    """Compiled Discretization.index, on the lookup arrays of the bot's discretization"""
+    return x_lut[int(xdif) + RAW_LIMIT] + y_lut[int(ydif) + RAW_LIMIT] + v_lut[vel + VEL_LIMIT]
+
+
+@nb.njit(cache=True)
+def pixel_collision(x1, y1, hitmask1, x2, y2, hitmask2):
+    """Checks if two objects collide and not just their rects"""
+    left = max(x1, x2)
+    top = max(y1, y2)
+    right = min(x1 + hitmask1.shape[0], x2 + hitmask2.shape[0])
+    bottom = min(y1 + hitmask1.shape[1], y2 + hitmask2.shape[1])
+
+    for x in range(left, right):
+        for y in range(top, bottom):
+            if hitmask1[x - x1, y - y1] and hitmask2[x - x2, y - y2]:
+                return True
+    return False
+
+
+@nb.njit(cache=True)
+def play_episode(
+    qvalues,
+    rng_state,
+    player_hitmasks,
+    pipe_hitmasks,
+    playery,
+    last_state,
+    last_action,
+    luts,
+    max_frames,
+    max_score,
+    record,
+):
+    """
+    Plays one game until the bird crashes, acting greedily on qvalues (an (N_STATES, 2) array).
+    luts are the (x_lut, y_lut, v_lut) lookup arrays of the state discretization. The game is truncated
+    after max_frames frames or once the score reaches max_score (0 = no cap).
+    Returns the (state, action, next state) history as integer arrays in the order Bot.act records
+    it, the score, the last action taken (the next game's first history entry starts from it) and
+    whether the game was truncated. With record=False only the last experience is kept (evaluation).
+    """
+    capacity = 1024
+    states = np.empty(capacity, dtype=np.int32)
+    actions = np.empty(capacity, dtype=np.int8)
+    next_states = np.empty(capacity, dtype=np.int32)
+    n = 0
+
+    # at most 3 pipe pairs are alive at the same time
+    pipe_x = np.empty(3, dtype=np.int64)
+    upper_y = np.empty(3, dtype=np.int64)
+    lower_y = np.empty(3, dtype=np.int64)
+    for i in range(2):
+        gap = random_gap(rng_state)
+        pipe_x[i] = SCREENWIDTH + 200 + i * (SCREENWIDTH // 2)
+        upper_y[i] = gap - PIPE_H
+        lower_y[i] = gap + PIPEGAPSIZE
+    n_pipes = 2
+
+    score = 0
+    player_index = 0
+    loop_iter = 0
+    cycle_pos = 0
+    playery = float(playery)
+    vel = PLAYER_FLAP_ACC
+    truncated = False
+
+    while True:
+        pipe = 0 if pipe_x[0] - PLAYERX > -30 else 1
+        state = map_state_index(luts[0], luts[1], luts[2], pipe_x[pipe] - PLAYERX, lower_y[pipe] - playery, vel)
+
+        # add the experience to the history, or overwrite the single entry when not recording
+        i = n if record else 0
+        if i == capacity:
+            capacity *= 2
+            states = np.concatenate((states, np.empty_like(states)))
+            actions = np.concatenate((actions, np.empty_like(actions)))
+            next_states = np.concatenate((next_states, np.empty_like(next_states)))
+        states[i] = last_state
+        actions[i] = last_action
+        next_states[i] = state
+        n += 1
+
+        # chooses 0 (don't flap) to tie-break
+        action = 0 if qvalues[state, 0] >= qvalues[state, 1] else 1
+        last_state = state
+        last_action = action
+
+        flapped = False
+        if action == 1 and playery > -2 * PLAYER_H:
+            vel = PLAYER_FLAP_ACC
+            flapped = True
+
+        # check for crash here, ground and top first
+        if playery + PLAYER_H >= BASEY - 1 or playery + PLAYER_H <= 0:
+            break
+        py = int(playery)
+        crashed = False
+        for i in range(n_pipes):
+            if pixel_collision(
+                PLAYERX, py, player_hitmasks[player_index], pipe_x[i], upper_y[i], pipe_hitmasks[0]
+            ) or pixel_collision(PLAYERX, py, player_hitmasks[player_index], pipe_x[i], lower_y[i], pipe_hitmasks[1]):
+                crashed = True
+                break
+        if crashed:
+            break
+
+        # check for score
+        for i in range(n_pipes):
+            pipe_mid = pipe_x[i] + PIPE_W / 2
+            if pipe_mid <= PLAYER_MID < pipe_mid + 4:
+                score += 1
+
+        # playerIndex change
+        if (loop_iter + 1) % 3 == 0:
+            player_index = INDEX_CYCLE[cycle_pos]
+            cycle_pos = (cycle_pos + 1) % 4
+        loop_iter = (loop_iter + 1) % 30
+
+        # player's movement
+        if vel < PLAYER_MAX_VEL_Y and not flapped:
+            vel += PLAYER_ACC_Y
+        playery += min(vel, BASEY - playery - PLAYER_H)
+
+        # move pipes to left
+        for i in range(n_pipes):
+            pipe_x[i] += PIPE_VEL_X
+
+        # add new pipe when first pipe is about to touch left of screen
+        if 0 < pipe_x[0] < 5:
+            gap = random_gap(rng_state)
+            pipe_x[n_pipes] = SCREENWIDTH + 10
+            upper_y[n_pipes] = gap - PIPE_H
+            lower_y[n_pipes] = gap + PIPEGAPSIZE
+            n_pipes += 1
+
+        # remove first pipe if its out of the screen
+        if pipe_x[0] < -PIPE_W:
+            for i in range(n_pipes - 1):
+                pipe_x[i] = pipe_x[i + 1]
+                upper_y[i] = upper_y[i + 1]
+                lower_y[i] = lower_y[i + 1]
+            n_pipes -= 1
+
+        if (max_frames > 0 and n >= max_frames) or (max_score > 0 and score >= max_score):
+            truncated = True
+            break
+
+    n = n if record else 1
+    return states[:n], actions[:n], next_states[:n], score, last_action, truncated
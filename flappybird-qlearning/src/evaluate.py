@@ -0,0 +1,123 @@
+"""
+Greedy evaluation of a trained Q table.
+
+The table is played by non-learning bots (Bot(learning=False): no history is recorded, nothing is
+updated or dumped) on a process pool. The games are split into chunks of CHUNK_GAMES games, each with
+its own pipe stream seeded from --seed, so the scores do not depend on the number of workers. A good
+table can fly for ever: every game is truncated after --max-frames frames, and the capped games are
+counted. The report gives the mean, median, 5th and 95th percentiles and max of the scores.
+
+    python evaluate.py --qvalues ../data/qvalues-trained.json --games 2000
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from bot import DATA_DIR, Bot
+from discretization import SPECS
+from flappy_sim import BACKENDS, PipeStream, play_games, spawn_seeds
+from policy import GreedyPolicy
+from qvalues_io import load_table
+
+CHUNK_GAMES = 50  # games of one pool task
+MAX_FRAMES = 100_000  # default frame cap of a game, a score of about 2700
+
+_qvalues = None  # table of the pool process, set by init_worker
+
+
+def init_worker(qvalues):
+    global _qvalues
+    _qvalues = qvalues
+
+
+def play_chunk(task):
+    """Plays a seeded chunk of games greedily, returns their scores and the number of capped games"""
+    games, seed, grid, backend, max_frames = task
+    bot = Bot(qvalues=_qvalues, spec=SPECS[grid], learning=False)
+    # the numpy backend steps the whole chunk as one batch and plays every game of it to its end
+    scores = list(play_games(bot, games, backend, PipeStream(seed), n_envs=games, max_frames=max_frames))
+    return scores, bot.truncatedCNT
+
+
+def evaluate(qvalues, games, seed=None, workers=None, backend="numba", max_frames=MAX_FRAMES, grid="10px"):
+    """Plays `games` greedy games of the (n_states, 2) qvalues, returns the score summary"""
+    chunks = [CHUNK_GAMES] * (games // CHUNK_GAMES) + ([games % CHUNK_GAMES] if games % CHUNK_GAMES else [])
+    seeds = spawn_seeds(seed, len(chunks))
+    tasks = [(n, chunkSeed, grid, backend, max_frames) for n, chunkSeed in zip(chunks, seeds)]
+
+    start = time.perf_counter()
+    with mp.Pool(workers, init_worker, (qvalues,)) as pool:
+        results = pool.map(play_chunk, tasks)
+    elapsed = time.perf_counter() - start
+
+    scores = np.array([score for chunk, _ in results for score in chunk])
+    p5, median, p95 = np.percentile(scores, (5, 50, 95)).tolist()
+    return {
+        "games": len(scores),
+        "capped": sum(capped for _, capped in results),
+        "mean": float(scores.mean()),
+        "median": median,
+        "p5": p5,
+        "p95": p95,
+        "max": int(scores.max()),
+        "elapsed_s": elapsed,
+        "games_per_s": len(scores) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser("evaluate.py")
+    parser.add_argument(
+        "--qvalues",
+        type=Path,
+        default=DATA_DIR / "qvalues-trained.json",
+        help="JSON, .bin or .policy (policy.py) table",
+    )
+    parser.add_argument("--games", type=int, default=1000, help="number of games to play")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the games' pipe generators")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--backend", choices=BACKENDS, default="numba", help="simulator backend (see flappy_sim.py)")
+    parser.add_argument("--max-frames", type=int, default=MAX_FRAMES, help="frame cap of a game, 0 = no cap")
+    parser.add_argument(
+        "--grid",
+        choices=list(SPECS),
+        default="10px",
+        help="state discretization played, a table of another grid is projected",
+    )
+    parser.add_argument("--output", type=Path, default=None, help="write the summary to this JSON file")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+
+    if args.qvalues.suffix == ".policy":
+        policy = GreedyPolicy(args.qvalues)
+        if policy.states.spec != SPECS[args.grid]:
+            raise ValueError(f"{args.qvalues} was exported for another grid than {args.grid}")
+        qvalues = policy.table()
+    else:
+        qvalues = load_table(args.qvalues, SPECS[args.grid])
+    summary = evaluate(qvalues, args.games, args.seed, args.workers, args.backend, args.max_frames, args.grid)
+    summary = dict(summary, qvalues=str(args.qvalues), seed=args.seed, max_frames=args.max_frames)
+    if args.output is not None:
+        with open(args.output, "w") as fd:
+            json.dump(summary, fd, indent=2)
+
+    logging.info(
+        f"{summary['games']} games ({summary['capped']} capped at {args.max_frames} frames):"
+        f" mean {summary['mean']:.1f}, median {summary['median']:.1f}, p5 {summary['p5']:.1f},"
+        f" p95 {summary['p95']:.1f}, max {summary['max']}"
+    )
+    logging.info(f"Time taken: {summary['elapsed_s']:.2f} s, {summary['games_per_s']:.1f} games/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import pickle
+import argparse
 import random
 import sys
 from itertools import cycle
@@ -10,17 +10,20 @@ from pygame.locals import K_ESCAPE, K_SPACE, K_UP, KEYDOWN, QUIT
 sys.path.append(str(Path(__file__).resolve().parent))
 
 from bot import Bot
+from flappy_sim import PLAYERX, FlappySim
+from hitmask_cache import sprite_hitmasks
+from policy import GreedyPolicy
 
-# Initialize the bot
-bot = Bot()
+bot = None  # the learning Bot, or the GreedyPolicy of --policy, created in main()
 
 # game parameters
 SCREENWIDTH = 288
 SCREENHEIGHT = 512
-FPS = 60
+FPS = 60  # frames simulated per second, 0 for an uncapped clock
+RENDER_EVERY = 1  # draw one frame out of RENDER_EVERY, sounds are only played when every frame is drawn
+TURBO_RENDER_EVERY = 25  # frame skip of --turbo
 
 # amount by which base can maximum shift to left
-PIPEGAPSIZE = 100  # gap between upper and lower part of pipe
 BASEY = SCREENHEIGHT * 0.79
 
 # image, sound and hitmask  dicts
@@ -61,9 +64,25 @@ PIPES_LIST = (f"{DATA_DIR}/assets/sprites/pipe-green.png", f"{DATA_DIR}/assets/s
 
 
 def main():
-    global SCREEN, FPSCLOCK, bot
+    global SCREEN, FPSCLOCK, FPS, RENDER_EVERY, bot
 
-    DUMP_HITMASKS = False
+    parser = argparse.ArgumentParser("flappy.py")
+    parser.add_argument("--fps", type=int, default=None, help=f"frames simulated per second, 0 = uncapped ({FPS})")
+    parser.add_argument("--render-every", type=int, default=None, help="draw one frame out of N (1)")
+    parser.add_argument(
+        "--turbo", action="store_true", help=f"uncapped clock, draws every {TURBO_RENDER_EVERY}th frame, no sound"
+    )
+    parser.add_argument("--policy", type=Path, default=None, help="play a frozen policy file (policy.py), no learning")
+    args = parser.parse_args()
+    if args.policy is not None:
+        bot = GreedyPolicy(args.policy)
+    else:
+        # dumps are written in the background so the game does not stutter every DUMPING_N games
+        bot = Bot(async_dump=True)
+    if args.turbo:
+        FPS, RENDER_EVERY = 0, TURBO_RENDER_EVERY
+    FPS = args.fps if args.fps is not None else FPS
+    RENDER_EVERY = max(1, args.render_every if args.render_every is not None else RENDER_EVERY)
 
     pygame.init()
     FPSCLOCK = pygame.time.Clock()
@@ -123,20 +142,11 @@ def main():
             pygame.image.load(PIPES_LIST[pipeindex]).convert_alpha(),
         )
 
-        # hismask for pipes
-        HITMASKS["pipe"] = (getHitmask(IMAGES["pipe"][0]), getHitmask(IMAGES["pipe"][1]))
-
-        # hitmask for player
-        HITMASKS["player"] = (
-            getHitmask(IMAGES["player"][0]),
-            getHitmask(IMAGES["player"][1]),
-            getHitmask(IMAGES["player"][2]),
-        )
-
-        if DUMP_HITMASKS:
-            with open(f"{DATA_DIR}/hitmasks_data.pkl", "wb") as output:
-                pickle.dump(HITMASKS, output, pickle.HIGHEST_PROTOCOL)
-            sys.exit()
+        # hitmasks of the sprites drawn, read from the cache (computed once per sprite file)
+        pipeMasks = sprite_hitmasks([(PIPES_LIST[pipeindex], 180), (PIPES_LIST[pipeindex], 0)])
+        HITMASKS["pipe"] = tuple(mask.tolist() for mask in pipeMasks)
+        playerMasks = sprite_hitmasks([(path, 0) for path in PLAYERS_LIST[randPlayer]])
+        HITMASKS["player"] = tuple(mask.tolist() for mask in playerMasks)
 
         movementInfo = showWelcomeAnimation()
         crashInfo = mainGame(movementInfo)
@@ -180,7 +190,8 @@ def showWelcomeAnimation():
                     'playerIndexGen': playerIndexGen,
                 }
         """
-        SOUNDS["wing"].play()
+        if RENDER_EVERY == 1:  # muted when frames are skipped, as in mainGame
+            SOUNDS["wing"].play()
         return {"playery": playery + playerShmVals["val"], "basex": basex, "playerIndexGen": playerIndexGen}
 
         # adjust playery, playerIndex, basex
@@ -201,131 +212,82 @@ def showWelcomeAnimation():
 
 
 def mainGame(movementInfo):
-
-    score = playerIndex = loopIter = 0
-    playerIndexGen = movementInfo["playerIndexGen"]
-
-    playerx, playery = int(SCREENWIDTH * 0.2), movementInfo["playery"]
+    # headless game rules, the pipe collisions use the hitmasks of the sprites drawn
+    sim = FlappySim(hitmasks=(HITMASKS["player"], HITMASKS["pipe"]))
+    sim.reset(movementInfo["playery"], movementInfo["playerIndexGen"])
 
     basex = movementInfo["basex"]
     baseShift = IMAGES["base"].get_width() - IMAGES["background"].get_width()
 
-    # get 2 new pipes to add to upperPipes lowerPipes list
-    newPipe1 = getRandomPipe()
-    newPipe2 = getRandomPipe()
-
-    # list of upper pipes
-    upperPipes = [
-        {"x": SCREENWIDTH + 200, "y": newPipe1[0]["y"]},
-        {"x": SCREENWIDTH + 200 + (SCREENWIDTH / 2), "y": newPipe2[0]["y"]},
-    ]
-
-    # list of lowerpipe
-    lowerPipes = [
-        {"x": SCREENWIDTH + 200, "y": newPipe1[1]["y"]},
-        {"x": SCREENWIDTH + 200 + (SCREENWIDTH / 2), "y": newPipe2[1]["y"]},
-    ]
-
-    pipeVelX = -4
-
-    # player velocity, max velocity, downward accleration, accleration on flap
-    playerVelY = -9  # player's velocity along Y, default same as playerFlapped
-    playerMaxVelY = 10  # max vel along Y, max descend speed
-    # playerMinVelY = -8  # min vel along Y, max ascend speed
-    playerAccY = 1  # players downward accleration
-    playerFlapAcc = -9  # players speed on flapping
-    playerFlapped = False  # True when player flaps
+    # the screen is drawn in full once, then only the areas of the moving sprites are redrawn and updated
+    SCREEN.blit(IMAGES["background"], (0, 0))
+    pygame.display.update()
+    dirtyRects = []
+    sound = RENDER_EVERY == 1
+    frame = 0
 
     while True:
-        if -playerx + lowerPipes[0]["x"] > -30:
-            myPipe = lowerPipes[0]
-        else:
-            myPipe = lowerPipes[1]
-
-        for event in pygame.event.get():
-            if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
-                pygame.quit()
-                sys.exit()
-            if event.type == KEYDOWN and (event.key == K_SPACE or event.key == K_UP):
-                if playery > -2 * IMAGES["player"][0].get_height():
-                    playerVelY = playerFlapAcc
-                    playerFlapped = True
-                    SOUNDS["wing"].play()
-
-        if bot.act(-playerx + myPipe["x"], -playery + myPipe["y"], playerVelY):
-            if playery > -2 * IMAGES["player"][0].get_height():
-                playerVelY = playerFlapAcc
-                playerFlapped = True
+        render = frame % RENDER_EVERY == 0
+        frame += 1
+        if render:
+            for event in pygame.event.get():
+                if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+                    pygame.quit()
+                    sys.exit()
+                if event.type == KEYDOWN and (event.key == K_SPACE or event.key == K_UP):
+                    if sim.flap() and sound:
+                        SOUNDS["wing"].play()
+
+        if bot.act(*sim.observe()):
+            if sim.flap() and sound:
                 SOUNDS["wing"].play()
 
-        # check for crash here
-        crashTest = checkCrash({"x": playerx, "y": playery, "index": playerIndex}, upperPipes, lowerPipes)
-        if crashTest[0]:
+        # check for crash, score and move everything
+        score = sim.score
+        if sim.step(0):
             # Update the q scores
             bot.update_scores()
 
             return {
-                "y": playery,
-                "groundCrash": crashTest[1],
+                "y": sim.playery,
+                "groundCrash": sim.ground_crash,
                 "basex": basex,
-                "upperPipes": upperPipes,
-                "lowerPipes": lowerPipes,
-                "score": score,
-                "playerVelY": playerVelY,
+                "upperPipes": [{"x": x, "y": y} for x, y in zip(sim.pipe_x, sim.upper_y)],
+                "lowerPipes": [{"x": x, "y": y} for x, y in zip(sim.pipe_x, sim.lower_y)],
+                "score": sim.score,
+                "playerVelY": sim.vel,
             }
+        if sim.score > score and sound:
+            SOUNDS["point"].play()
 
-        # check for score
-        playerMidPos = playerx + IMAGES["player"][0].get_width() / 2
-        for pipe in upperPipes:
-            pipeMidPos = pipe["x"] + IMAGES["pipe"][0].get_width() / 2
-            if pipeMidPos <= playerMidPos < pipeMidPos + 4:
-                score += 1
-                SOUNDS["point"].play()
-
-        # playerIndex basex change
-        if (loopIter + 1) % 3 == 0:
-            playerIndex = next(playerIndexGen)
-        loopIter = (loopIter + 1) % 30
+        # basex change
         basex = -((-basex + 100) % baseShift)
 
-        # player's movement
-        if playerVelY < playerMaxVelY and not playerFlapped:
-            playerVelY += playerAccY
-        if playerFlapped:
-            playerFlapped = False
-        playerHeight = IMAGES["player"][playerIndex].get_height()
-        playery += min(playerVelY, BASEY - playery - playerHeight)
+        if render:
+            dirtyRects = drawFrame(sim, basex, dirtyRects)
+        FPSCLOCK.tick(FPS)
 
-        # move pipes to left
-        for uPipe, lPipe in zip(upperPipes, lowerPipes):
-            uPipe["x"] += pipeVelX
-            lPipe["x"] += pipeVelX
 
-        # add new pipe when first pipe is about to touch left of screen
-        if 0 < upperPipes[0]["x"] < 5:
-            newPipe = getRandomPipe()
-            upperPipes.append(newPipe[0])
-            lowerPipes.append(newPipe[1])
+def drawFrame(sim, basex, dirtyRects):
+    """
+    Erases the sprites drawn at dirtyRects, draws the sprites of the current frame and updates the display
+    in both areas only, returns the areas drawn
+    """
+    for rect in dirtyRects:
+        SCREEN.blit(IMAGES["background"], rect, rect)
 
-        # remove first pipe if its out of the screen
-        if upperPipes[0]["x"] < -IMAGES["pipe"][0].get_width():
-            upperPipes.pop(0)
-            lowerPipes.pop(0)
+    rects = []
+    for x, upperY, lowerY in zip(sim.pipe_x, sim.upper_y, sim.lower_y):
+        rects.append(SCREEN.blit(IMAGES["pipe"][0], (x, upperY)))
+        rects.append(SCREEN.blit(IMAGES["pipe"][1], (x, lowerY)))
 
-        # draw sprites
-        SCREEN.blit(IMAGES["background"], (0, 0))
+    rects.append(SCREEN.blit(IMAGES["base"], (basex, BASEY)))
+    # print score so player overlaps the score
+    rects += showScore(sim.score)
+    rects.append(SCREEN.blit(IMAGES["player"][sim.player_index], (PLAYERX, sim.playery)))
 
-        for uPipe, lPipe in zip(upperPipes, lowerPipes):
-            SCREEN.blit(IMAGES["pipe"][0], (uPipe["x"], uPipe["y"]))
-            SCREEN.blit(IMAGES["pipe"][1], (lPipe["x"], lPipe["y"]))
-
-        SCREEN.blit(IMAGES["base"], (basex, BASEY))
-        # print score so player overlaps the score
-        showScore(score)
-        SCREEN.blit(IMAGES["player"][playerIndex], (playerx, playery))
-
-        pygame.display.update()
-        FPSCLOCK.tick(FPS)
+    pygame.display.update(dirtyRects + rects)
+    return rects
 
 
 def showGameOverScreen(crashInfo):
@@ -341,10 +303,11 @@ def showGameOverScreen(crashInfo):
 
     upperPipes, lowerPipes = crashInfo["upperPipes"], crashInfo["lowerPipes"]
 
-    # play hit and die sounds
-    SOUNDS["hit"].play()
-    if not crashInfo["groundCrash"]:
-        SOUNDS["die"].play()
+    # play hit and die sounds, muted when frames are skipped as in mainGame
+    if RENDER_EVERY == 1:
+        SOUNDS["hit"].play()
+        if not crashInfo["groundCrash"]:
+            SOUNDS["die"].play()
 
     while True:
         """De-activated press key functionality
@@ -392,22 +355,8 @@ def playerShm(playerShm):
         playerShm["val"] -= 1
 
 
-def getRandomPipe():
-    """returns a randomly generated pipe"""
-    # y of gap between upper and lower pipe
-    gapY = random.randrange(0, int(BASEY * 0.6 - PIPEGAPSIZE))
-    gapY += int(BASEY * 0.2)
-    pipeHeight = IMAGES["pipe"][0].get_height()
-    pipeX = SCREENWIDTH + 10
-
-    return [
-        {"x": pipeX, "y": gapY - pipeHeight},  # upper pipe
-        {"x": pipeX, "y": gapY + PIPEGAPSIZE},  # lower pipe
-    ]
-
-
 def showScore(score):
-    """displays score in center of screen"""
+    """displays score in center of screen, returns the rects of the digits"""
     scoreDigits = [int(x) for x in list(str(score))]
     totalWidth = 0  # total width of all numbers to be printed
 
@@ -416,71 +365,11 @@ def showScore(score):
 
     Xoffset = (SCREENWIDTH - totalWidth) / 2
 
+    rects = []
     for digit in scoreDigits:
-        SCREEN.blit(IMAGES["numbers"][digit], (Xoffset, SCREENHEIGHT * 0.1))
+        rects.append(SCREEN.blit(IMAGES["numbers"][digit], (Xoffset, SCREENHEIGHT * 0.1)))
         Xoffset += IMAGES["numbers"][digit].get_width()
-
-
-def checkCrash(player, upperPipes, lowerPipes):
-    """returns True if player collders with base or pipes."""
-    pi = player["index"]
-    player["w"] = IMAGES["player"][0].get_width()
-    player["h"] = IMAGES["player"][0].get_height()
-
-    # if player crashes into ground
-    if (player["y"] + player["h"] >= BASEY - 1) or (player["y"] + player["h"] <= 0):
-        return [True, True]
-    else:
-
-        playerRect = pygame.Rect(player["x"], player["y"], player["w"], player["h"])
-        pipeW = IMAGES["pipe"][0].get_width()
-        pipeH = IMAGES["pipe"][0].get_height()
-
-        for uPipe, lPipe in zip(upperPipes, lowerPipes):
-            # upper and lower pipe rects
-            uPipeRect = pygame.Rect(uPipe["x"], uPipe["y"], pipeW, pipeH)
-            lPipeRect = pygame.Rect(lPipe["x"], lPipe["y"], pipeW, pipeH)
-
-            # player and upper/lower pipe hitmasks
-            pHitMask = HITMASKS["player"][pi]
-            uHitmask = HITMASKS["pipe"][0]
-            lHitmask = HITMASKS["pipe"][1]
-
-            # if bird collided with upipe or lpipe
-            uCollide = pixelCollision(playerRect, uPipeRect, pHitMask, uHitmask)
-            lCollide = pixelCollision(playerRect, lPipeRect, pHitMask, lHitmask)
-
-            if uCollide or lCollide:
-                return [True, False]
-
-    return [False, False]
-
-
-def pixelCollision(rect1, rect2, hitmask1, hitmask2):
-    """Checks if two objects collide and not just their rects"""
-    rect = rect1.clip(rect2)
-
-    if rect.width == 0 or rect.height == 0:
-        return False
-
-    x1, y1 = rect.x - rect1.x, rect.y - rect1.y
-    x2, y2 = rect.x - rect2.x, rect.y - rect2.y
-
-    for x in range(rect.width):
-        for y in range(rect.height):
-            if hitmask1[x1 + x][y1 + y] and hitmask2[x2 + x][y2 + y]:
-                return True
-    return False
-
-
-def getHitmask(image):
-    """returns a hitmask using an image's alpha."""
-    mask = []
-    for x in range(image.get_width()):
-        mask.append([])
-        for y in range(image.get_height()):
-            mask[x].append(bool(image.get_at((x, y))[3]))
-    return mask
+    return rects
 
 
 if __name__ == "__main__":
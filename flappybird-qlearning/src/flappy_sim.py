@@ -0,0 +1,363 @@
+"""
+Headless Flappy Bird simulator, the single reference of the game rules used by the trainers.
+
+FlappySim steps one game in plain Python with the semantics of the original learn.py: the bot acts on
+(xdif, ydif, vel) of the next lower pipe, the flap is applied before the crash check, the score, the
+animation frame, the physics and the pipes are then advanced. play_games runs the same rules on one of
+the backends:
+
+- "python": FlappySim, works with dict and dense bots
+- "numpy": learn_vec.VecFlappy, n_envs games stepped together as arrays (dense bots)
+- "numba": episode_jit.play_episode, whole games compiled (dense bots)
+
+Pipe gaps come from a PipeStream, blocks of splitmix64 draws pre-computed with NumPy and read through a
+cursor; the compiled episodes draw the same sequence in place. From the same seed the python, numba and
+single-env numpy backends play exactly the same games.
+"""
+
+import random
+from itertools import cycle
+from time import perf_counter_ns
+
+import numpy as np
+from phase_counters import COUNTERS
+
+SCREENWIDTH = 288
+SCREENHEIGHT = 512
+PIPEGAPSIZE = 100  # gap between upper and lower part of pipe
+BASEY = SCREENHEIGHT * 0.79
+
+PIPE_W, PIPE_H = 52, 320
+PLAYER_W, PLAYER_H = 34, 24
+
+PLAYERX = int(SCREENWIDTH * 0.2)
+PLAYER_START_Y = int((SCREENHEIGHT - PLAYER_H) / 2)
+PLAYER_MID = PLAYERX + PLAYER_W / 2
+PIPE_VEL_X = -4
+PLAYER_MAX_VEL_Y = 10  # max vel along Y, max descend speed
+PLAYER_ACC_Y = 1  # players downward accleration
+PLAYER_FLAP_ACC = -9  # players speed on flapping
+PLAYER_INDEX_CYCLE = (0, 1, 2, 1)
+
+GAP_LOW = int(BASEY * 0.2)
+GAP_RANGE = int(BASEY * 0.6 - PIPEGAPSIZE)
+
+BACKENDS = ("python", "numpy", "numba")
+
+MASK64 = (1 << 64) - 1
+SPLITMIX_GAMMA = 0x9E3779B97F4A7C15
+PIPE_BLOCK = 4096  # gaps drawn per block
+
+
+def splitmix_block(state, n):
+    """The n splitmix64 outputs following state as a uint64 array, the sequence of episode_jit.next_random"""
+    z = np.uint64(state) + np.arange(1, n + 1, dtype=np.uint64) * np.uint64(SPLITMIX_GAMMA)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def spawn_seeds(seed, n):
+    """n independent 64-bit seeds of pipe streams derived from seed (None: fresh entropy)"""
+    return [int(s.generate_state(1, np.uint64)[0]) for s in np.random.SeedSequence(seed).spawn(n)]
+
+
+class PipeStream(object):
+    """
+    Seeded stream of pipe gap heights, pre-drawn in NumPy blocks of `block` gaps and read through a cursor.
+    The blocks are splitmix64 outputs, the sequence episode_jit.next_random draws inside the compiled
+    episodes, and `state` is the generator state at the cursor so the numba backend can continue the
+    stream where the others stopped (and the other way round).
+    """
+
+    __slots__ = ("base", "block", "values", "items", "cursor")
+
+    def __init__(self, seed=None, block=PIPE_BLOCK):
+        self.block = block
+        self.seek((random.getrandbits(64) if seed is None else seed) & MASK64)
+
+    @property
+    def state(self):
+        """splitmix64 state of the next gap"""
+        return (self.base + self.cursor * SPLITMIX_GAMMA) & MASK64
+
+    @state.setter
+    def state(self, state):
+        self.seek(state)
+
+    def seek(self, state):
+        """Drops the drawn gaps, the next block starts at generator state"""
+        self.base = state & MASK64
+        self.values = np.empty(0, dtype=np.int64)
+        self.items = []
+        self.cursor = 0
+
+    def refill(self):
+        """Draws the block following the current one"""
+        self.base = (self.base + len(self.values) * SPLITMIX_GAMMA) & MASK64
+        self.values = (splitmix_block(self.base, self.block) % np.uint64(GAP_RANGE)).astype(np.int64) + GAP_LOW
+        self.items = self.values.tolist()
+        self.cursor = 0
+
+    def gap(self):
+        """y of the gap between upper and lower pipe, same range as getRandomPipe"""
+        if self.cursor == len(self.items):
+            self.refill()
+        gap = self.items[self.cursor]
+        self.cursor += 1
+        return gap
+
+    def gaps(self, n):
+        """The next n gaps as an int64 array"""
+        parts = []
+        while n > 0:
+            if self.cursor == len(self.values):
+                self.refill()
+            take = min(n, len(self.values) - self.cursor)
+            parts.append(self.values[self.cursor : self.cursor + take])
+            self.cursor += take
+            n -= take
+        return np.concatenate(parts) if len(parts) != 1 else parts[0]
+
+
+def pixel_collision(x1, y1, hitmask1, x2, y2, hitmask2):
+    """Checks if two objects collide and not just their rects"""
+    left, right = max(x1, x2), min(x1 + len(hitmask1), x2 + len(hitmask2))
+    top, bottom = max(y1, y2), min(y1 + len(hitmask1[0]), y2 + len(hitmask2[0]))
+
+    for x in range(left, right):
+        col1, col2 = hitmask1[x - x1], hitmask2[x - x2]
+        for y in range(top, bottom):
+            if col1[y - y1] and col2[y - y2]:
+                return True
+    return False
+
+
+class FlappySim(object):
+    """
+    One headless game. Pipes are kept as parallel lists (x, upper pipe y, lower pipe y).
+    Pipe collisions use the pixel test when hitmasks ((player masks, pipe masks)) are given,
+    the precomputed CollisionTable otherwise. Call reset() to start a game.
+    """
+
+    __slots__ = (
+        "rng",
+        "crash_table",
+        "hitmasks",
+        "playery",
+        "vel",
+        "flapped",
+        "score",
+        "loop_iter",
+        "player_index",
+        "index_gen",
+        "pipe_x",
+        "upper_y",
+        "lower_y",
+        "ground_crash",
+    )
+
+    def __init__(self, rng=None, crash_table=None, hitmasks=None):
+        self.rng = rng if rng is not None else PipeStream()
+        self.hitmasks = hitmasks
+        if hitmasks is None and crash_table is None:
+            from collision_table import load_table
+
+            crash_table = load_table()
+        self.crash_table = crash_table
+
+    def reset(self, playery=PLAYER_START_Y, player_index_gen=None):
+        """Starts a new game, player_index_gen is the animation frame cycle (already advanced on a welcome screen)"""
+        self.playery = playery
+        self.vel = PLAYER_FLAP_ACC  # player's velocity along Y, default same as playerFlapped
+        self.flapped = False
+        self.score = 0
+        self.loop_iter = 0
+        self.player_index = 0
+        self.index_gen = player_index_gen if player_index_gen is not None else cycle(PLAYER_INDEX_CYCLE)
+        self.ground_crash = False
+
+        self.pipe_x, self.upper_y, self.lower_y = [], [], []
+        self.add_pipe(SCREENWIDTH + 200)
+        self.add_pipe(SCREENWIDTH + 200 + SCREENWIDTH // 2)
+
+    def add_pipe(self, x):
+        """Appends a pipe pair with a random gap at x"""
+        gap = self.rng.gap()
+        self.pipe_x.append(x)
+        self.upper_y.append(gap - PIPE_H)
+        self.lower_y.append(gap + PIPEGAPSIZE)
+
+    def observe(self):
+        """Returns the (xdif, ydif, vel) of the next lower pipe the bot acts on"""
+        i = 0 if self.pipe_x[0] - PLAYERX > -30 else 1
+        return self.pipe_x[i] - PLAYERX, self.lower_y[i] - self.playery, self.vel
+
+    def flap(self):
+        """Flaps unless the bird is too far above the screen, returns True if it flapped"""
+        if self.playery > -2 * PLAYER_H:
+            self.vel = PLAYER_FLAP_ACC
+            self.flapped = True
+            return True
+        return False
+
+    def step(self, action):
+        """Advances the game by one frame, flapping first if action is 1. Returns True if the bird crashed"""
+        if action:
+            self.flap()
+
+        # check for crash here
+        if self.check_crash():
+            return True
+
+        self.advance()
+        return False
+
+    def advance(self):
+        """Scores, then moves the player and the pipes by one frame"""
+        # check for score
+        for x in self.pipe_x:
+            pipeMid = x + PIPE_W / 2
+            if pipeMid <= PLAYER_MID < pipeMid + 4:
+                self.score += 1
+
+        # playerIndex change
+        if (self.loop_iter + 1) % 3 == 0:
+            self.player_index = next(self.index_gen)
+        self.loop_iter = (self.loop_iter + 1) % 30
+
+        # player's movement
+        if self.vel < PLAYER_MAX_VEL_Y and not self.flapped:
+            self.vel += PLAYER_ACC_Y
+        self.flapped = False
+        self.playery += min(self.vel, BASEY - self.playery - PLAYER_H)
+
+        # move pipes to left
+        pipe_x = self.pipe_x
+        for i in range(len(pipe_x)):
+            pipe_x[i] += PIPE_VEL_X
+
+        # add new pipe when first pipe is about to touch left of screen
+        if 0 < pipe_x[0] < 5:
+            self.add_pipe(SCREENWIDTH + 10)
+
+        # remove first pipe if its out of the screen
+        if pipe_x[0] < -PIPE_W:
+            del pipe_x[0], self.upper_y[0], self.lower_y[0]
+
+    def check_crash(self):
+        """returns True if player collides with base, top or pipes."""
+        bottom = self.playery + PLAYER_H
+        if bottom >= BASEY - 1 or bottom <= 0:
+            self.ground_crash = True
+            return True
+
+        py = int(self.playery)  # pygame.Rect truncation
+        pi = self.player_index
+        if self.hitmasks is None:
+            collides = self.crash_table.collides
+            for x, upperY, lowerY in zip(self.pipe_x, self.upper_y, self.lower_y):
+                dx = PLAYERX - int(x)
+                if collides(pi, 0, dx, py - upperY) or collides(pi, 1, dx, py - lowerY):
+                    return True
+        else:
+            playerMask, (upperMask, lowerMask) = self.hitmasks[0][pi], self.hitmasks[1]
+            for x, upperY, lowerY in zip(self.pipe_x, self.upper_y, self.lower_y):
+                x = int(x)
+                if not -PLAYER_W < PLAYERX - x < PIPE_W:
+                    continue  # the rects do not overlap
+                if pixel_collision(PLAYERX, py, playerMask, x, upperY, upperMask) or pixel_collision(
+                    PLAYERX, py, playerMask, x, lowerY, lowerMask
+                ):
+                    return True
+        return False
+
+    def play(self, bot, max_frames=0, max_score=0):
+        """
+        Plays one game with the bot, updates its Q values once the bird crashed and returns the score.
+        Same frames as step, timed per phase into COUNTERS. The game is truncated (updated without the
+        death penalty) after max_frames frames or once the score reaches max_score, 0 = no cap.
+        """
+        self.reset()
+        act, observe, flap, check_crash, advance = bot.act, self.observe, self.flap, self.check_crash, self.advance
+        frames = act_ns = crash_ns = move_ns = 0
+        truncated = False
+
+        t0 = perf_counter_ns()
+        while True:
+            if act(*observe()):
+                flap()
+            t1 = perf_counter_ns()
+            crashed = check_crash()
+            t2 = perf_counter_ns()
+            act_ns += t1 - t0
+            crash_ns += t2 - t1
+            frames += 1
+            if crashed:
+                break
+            advance()
+            t0 = perf_counter_ns()
+            move_ns += t0 - t2
+            if (max_frames and frames >= max_frames) or (max_score and self.score >= max_score):
+                truncated = True
+                break
+
+        COUNTERS.add("act", act_ns, frames)
+        COUNTERS.add("crash_check", crash_ns, frames)
+        COUNTERS.add("physics_pipes", move_ns, frames if truncated else frames - 1)
+        bot.update_scores(dump_qvalues=False, truncated=truncated)
+        return self.score
+
+
+def play_games(bot, games, backend="python", rng=None, n_envs=256, hitmasks=None, max_frames=0, max_score=0):
+    """
+    Plays `games` games with the bot on the given backend, yields the score of every finished game.
+    hitmasks switches the python backend to the pixel collision test, n_envs is used by the numpy backend.
+    Games are truncated after max_frames frames or once their score reaches max_score (0 = no cap):
+    their history is learned without the death penalty and counted in bot.truncatedCNT.
+    """
+    rng = rng if rng is not None else PipeStream()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend != "python" and not bot.dense:
+        raise ValueError(f"The {backend} backend needs a Bot(dense=True)")
+
+    if backend == "python":
+        sim = FlappySim(rng, hitmasks=hitmasks)
+        COUNTERS.first_frame()
+        for _ in range(games):
+            yield sim.play(bot, max_frames, max_score)
+
+    elif backend == "numpy":
+        from learn_vec import iter_games
+
+        yield from iter_games(bot, n_envs, games, rng, max_frames, max_score)
+
+    else:
+        from episode_jit import new_rng_state, play_episode
+        from hitmask_cache import load_hitmasks
+
+        player_hitmasks, pipe_hitmasks = (np.array(masks) for masks in load_hitmasks())
+        rng_state = new_rng_state(rng.state)
+        COUNTERS.first_frame()  # the first episode still loads the compiled code
+        for _ in range(games):
+            start = perf_counter_ns()
+            states, actions, nextStates, score, lastAction, truncated = play_episode(
+                bot.qvalues,
+                rng_state,
+                player_hitmasks,
+                pipe_hitmasks,
+                PLAYER_START_Y,
+                bot.last_state,
+                bot.last_action,
+                bot.states.luts,
+                max_frames,
+                max_score,
+                bot.learning,
+            )
+            COUNTERS.add("episode", perf_counter_ns() - start, len(states))
+            rng.state = int(rng_state[0])
+            bot.last_state = int(nextStates[-1])
+            bot.last_action = int(lastAction)
+            bot.update_scores(dump_qvalues=False, moves=(states, actions, nextStates), truncated=truncated)
+            yield score
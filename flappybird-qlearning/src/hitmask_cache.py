@@ -0,0 +1,107 @@
+"""
+Hitmasks of the sprites, cached by content hash.
+
+A hitmask is the boolean (width, height) array of the opaque pixels of a sprite, indexed hitmask[x][y]
+like the masks of the old getHitmask. Missing ones are computed from pygame.mask (which honours both the
+per-pixel alpha and the colorkey of a sprite) through pygame.surfarray, and stored bit-packed in
+data/hitmasks_cache.npz under the sha256 of the sprite file and its rotation: an edited sprite gets a
+new key, so the cache never has to be cleared or dumped by hand. flappy.py, the headless trainers and
+the deep-learning game (game/flappy_bird_utils.py) all read their hitmasks from it. The cache file is
+committed with the masks of every sprite of both games, so pygame is only imported when a sprite file
+changed (or a new one is used).
+"""
+
+import hashlib
+import io
+import zipfile
+from pathlib import Path
+
+import numpy as np
+from qvalues_io import write_atomic
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+CACHE_PATH = DATA_DIR / "hitmasks_cache.npz"
+SPRITES_DIR = DATA_DIR / "assets" / "sprites"
+
+# sprites of the headless games: red bird, green pipe (upper pipe = pipe rotated by 180 degrees)
+PLAYER_SPRITES = tuple(SPRITES_DIR / f"redbird-{flap}flap.png" for flap in ("up", "mid", "down"))
+PIPE_SPRITE = SPRITES_DIR / "pipe-green.png"
+
+_loaded = {}  # cache path -> {key: hitmask} read in this process
+
+
+def sprite_key(path, rotate=0):
+    """Cache key of the sprite file rotated by `rotate` degrees"""
+    digest = hashlib.sha256(Path(path).read_bytes())
+    digest.update(f":{rotate}".encode())
+    return digest.hexdigest()
+
+
+def compute_hitmask(path, rotate=0):
+    """Hitmask of the sprite file rotated by `rotate` degrees"""
+    import pygame
+
+    surface = pygame.image.load(str(path))
+    if rotate:
+        surface = pygame.transform.rotate(surface, rotate)
+    mask = pygame.mask.from_surface(surface, 0)
+    opaque = mask.to_surface(setcolor=(255, 255, 255, 255), unsetcolor=(0, 0, 0, 0))
+    return pygame.surfarray.array_alpha(opaque) != 0
+
+
+def read_cache(cache_path):
+    """The {key: hitmask} entries of the cache file, empty if it is missing or unreadable"""
+    entries = {}
+    try:
+        with np.load(cache_path) as cache:
+            for name in cache.files:
+                if name.startswith("bits_"):
+                    key = name[len("bits_") :]
+                    shape = tuple(cache[f"shape_{key}"])
+                    bits = np.unpackbits(cache[name], count=int(np.prod(shape)))
+                    entries[key] = bits.astype(bool).reshape(shape)
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        pass  # missing or partially written cache
+    return entries
+
+
+def write_cache(cache_path, entries):
+    """Atomically replaces the cache file with the entries"""
+    arrays = {}
+    for key, mask in entries.items():
+        arrays[f"bits_{key}"] = np.packbits(mask, axis=None)
+        arrays[f"shape_{key}"] = np.array(mask.shape)
+
+    data = io.BytesIO()
+    np.savez_compressed(data, **arrays)
+    write_atomic(cache_path, (data.getbuffer(),))
+
+
+def sprite_hitmasks(sprites, cache_path=CACHE_PATH):
+    """Hitmasks of the (sprite path, rotation) pairs, the missing ones are computed and cached"""
+    cache_path = str(cache_path)
+    if cache_path not in _loaded:
+        _loaded[cache_path] = read_cache(cache_path)
+    entries = _loaded[cache_path]
+
+    keys = [sprite_key(path, rotate) for path, rotate in sprites]
+    missing = [(key, sprite) for key, sprite in zip(keys, sprites) if key not in entries]
+    if missing:
+        entries.update(read_cache(cache_path))  # entries added by other processes
+        for key, (path, rotate) in missing:
+            entries[key] = compute_hitmask(path, rotate)
+        write_cache(cache_path, entries)
+    return [entries[key] for key in keys]
+
+
+def load_hitmasks(player_sprites=PLAYER_SPRITES, pipe_sprite=PIPE_SPRITE, cache_path=CACHE_PATH):
+    """(player, pipe) lists of the hitmasks of the player frames and of the upper and lower pipe"""
+    player = sprite_hitmasks([(path, 0) for path in player_sprites], cache_path)
+    pipe = sprite_hitmasks([(pipe_sprite, 180), (pipe_sprite, 0)], cache_path)
+    return player, pipe
+
+
+def pixel_hitmasks(player_sprites=PLAYER_SPRITES, pipe_sprite=PIPE_SPRITE, cache_path=CACHE_PATH):
+    """load_hitmasks as nested lists, the fastest to index in flappy_sim.pixel_collision"""
+    player, pipe = load_hitmasks(player_sprites, pipe_sprite, cache_path)
+    return [mask.tolist() for mask in player], [mask.tolist() for mask in pipe]
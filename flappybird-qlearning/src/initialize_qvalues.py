@@ -1,18 +1,35 @@
-"""Script to create Q-Value JSON file, initializing with zeros"""
+"""
+Script to create Q-Value JSON and binary files, initializing with zeros, or with the values of a table
+trained on another (coarser) grid (--from) projected onto the bins of --grid
+"""
 
+import argparse
 import json
 from pathlib import Path
 
-# 定义 X, Y, 以及速度的范围
-x_values = list(range(-40, 140, 10)) + list(range(140, 421, 70))
-y_values = list(range(-300, 180, 10)) + list(range(180, 421, 60))
-v_values = range(-10, 11)
+from discretization import SPECS, Discretization
+from qvalues_io import read_table, save_qvalues
+
+parser = argparse.ArgumentParser("initialize_qvalues.py")
+parser.add_argument("--grid", choices=list(SPECS), default="10px", help="state discretization (see discretization.py)")
+parser.add_argument("--from", dest="source", type=Path, default=None, help="JSON or .bin table to project")
+args = parser.parse_args()
+
+# 状态网格 (X, Y 以及速度的范围) 由 discretization.py 中的离散化规格定义，与 Bot 共用
+states = Discretization(SPECS[args.grid])
 
 # 生成 q 值字典，键格式为 "x_y_v"，初始值为 [0, 0]
-qval = {f"{x}_{y}_{v}": [0, 0] for x in x_values for y in y_values for v in v_values}
+qval = {key: [0, 0] for key in states.keys}
+if args.source is not None:
+    # 粗网格的 Q 表按区间映射到新网格: 每个新状态取包含其下边界的粗状态的 q 值
+    qvalues, spec = read_table(args.source)
+    qval = dict(zip(states.keys, Discretization(spec).project(qvalues, states).tolist()))
 
 data_dir = Path(__file__).resolve().parent.parent / "data"
 data_dir.mkdir(parents=True, exist_ok=True)  # 确保 data 目录存在
 
 with open(data_dir / "qvalues.json", "w") as fd:
     json.dump(qval, fd)
+
+# 稠密模式使用的二进制 Q 表，状态顺序与上面的键一致
+save_qvalues(data_dir / "qvalues.bin", list(qval.values()), states.grid)
@@ -0,0 +1,209 @@
+"""
+Parallel trainer: K worker processes play games against one Q table in shared memory.
+
+The dense Q table lives in a multiprocessing.shared_memory block. Every worker plays its own games
+with the compiled episode kernel and applies Bot.update_scores straight to the shared table, without
+locks (Hogwild-style: concurrent updates of the same state may overwrite each other, which Q-learning
+tolerates). The coordinator aggregates game counts and scores from the workers and dumps the table
+periodically on a background checkpoint writer, so the workers' reports keep being drained. With
+--compact-every, the block also holds the dirty flags of the rows: the workers flag the rows they update
+and the coordinator's dumps only append these rows to the delta log (see Bot). A worker that raises or
+is killed ends the run with an error, the other workers are terminated.
+"""
+
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from bot import N_STATES, Bot
+from episode_jit import new_rng_state, play_episode
+from flappy_sim import PLAYER_START_Y, spawn_seeds
+from hitmask_cache import load_hitmasks
+from score_stats import ScoreStats
+
+REPORT_N = 50  # games a worker plays between two reports to the coordinator
+POLL_S = 1.0  # seconds the coordinator waits for a report before checking that the workers are alive
+
+
+def shared_arrays(shm, track_dirty):
+    """The (N_STATES, 2) Q table in the shared block, and the dirty flags following it (None if not tracked)"""
+    qvalues = np.ndarray((N_STATES, 2), dtype=np.float64, buffer=shm.buf)
+    dirty = np.ndarray(N_STATES, dtype=bool, buffer=shm.buf, offset=qvalues.nbytes) if track_dirty else None
+    return qvalues, dirty
+
+
+def worker(shm_name, games, seed, results, max_frames=0, max_score=0, track_dirty=False):
+    """
+    Plays `games` games on the shared Q table, reporting the scores in batches of REPORT_N with the number
+    of games truncated at the max_frames/max_score cap, then None once all games are played
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        qvalues, dirty = shared_arrays(shm, track_dirty)
+        bot = Bot(qvalues=qvalues)
+        bot.dirty = dirty  # the rows updated here are flagged for the coordinator's dumps
+        player_hitmasks, pipe_hitmasks = (np.array(masks) for masks in load_hitmasks())
+        rng_state = new_rng_state(seed)
+
+        scores = []
+        truncatedCNT = 0
+        for _ in range(games):
+            states, actions, nextStates, score, lastAction, truncated = play_episode(
+                bot.qvalues,
+                rng_state,
+                player_hitmasks,
+                pipe_hitmasks,
+                PLAYER_START_Y,
+                bot.last_state,
+                bot.last_action,
+                bot.states.luts,
+                max_frames,
+                max_score,
+                True,
+            )
+            bot.last_state = int(nextStates[-1])
+            bot.last_action = int(lastAction)
+            bot.update_scores(dump_qvalues=False, moves=(states, actions, nextStates), truncated=truncated)
+
+            scores.append(score)
+            truncatedCNT += truncated
+            if len(scores) == REPORT_N:
+                results.put((scores, truncatedCNT))
+                scores, truncatedCNT = [], 0
+
+        results.put((scores, truncatedCNT))
+        results.put(None)
+        del bot, qvalues, dirty  # release the buffer exports before closing the block
+    finally:
+        shm.close()
+
+
+def check_workers(procs):
+    """Raises RuntimeError if a worker process exited with a non-zero code"""
+    failed = [(i, proc.exitcode) for i, proc in enumerate(procs) if proc.exitcode not in (None, 0)]
+    if failed:
+        raise RuntimeError("Worker(s) failed: " + ", ".join(f"{i} exited with code {code}" for i, code in failed))
+
+
+def train(iterations, workers, seed=None, dump_every=1000, stats=None, max_frames=0, max_score=0, compact_every=None):
+    """
+    Runs `iterations` games split over `workers` processes, returns the coordinator's Bot (whose Q table
+    holds the final shared values) and the scores in the order they were reported.
+    stats is a ScoreStats fed the scores as they are reported (see score_stats.py). Games are truncated
+    after max_frames frames or once their score reaches max_score (0 = no cap). compact_every switches
+    the dumps to the delta log (see Bot).
+    Raises RuntimeError as soon as a worker exits with an error (an exception, or killed by a signal).
+    """
+    bot = Bot(dense=True, async_dump=True, compact_every=compact_every)
+    track_dirty = bot.dirty is not None
+    shm = shared_memory.SharedMemory(create=True, size=bot.qvalues.nbytes + N_STATES * track_dirty)
+    try:
+        shared, dirty = shared_arrays(shm, track_dirty)
+        shared[:] = bot.qvalues
+        bot.qvalues = shared
+        if track_dirty:
+            dirty[:] = False
+            bot.dirty = dirty
+
+        seeds = spawn_seeds(seed, workers)
+        quotas = [iterations // workers + (i < iterations % workers) for i in range(workers)]
+        results = mp.Queue()
+        procs = [
+            mp.Process(target=worker, args=(shm.name, quotas[i], seeds[i], results, max_frames, max_score, track_dirty))
+            for i in range(workers)
+        ]
+        for proc in procs:
+            proc.start()
+
+        try:
+            scores = []
+            running = workers
+            nextDump = dump_every
+            while running:
+                # a worker that died never reports None, the ones still running are checked meanwhile
+                check_workers(procs)
+                try:
+                    report = results.get(timeout=POLL_S)
+                except queue.Empty:
+                    continue
+                if report is None:
+                    running -= 1
+                    continue
+
+                batch, truncatedCNT = report
+                scores.extend(batch)
+                bot.truncatedCNT += truncatedCNT
+                if stats is not None:
+                    for score in batch:
+                        stats.add(score)
+                bot.gameCNT = len(scores)
+                if bot.gameCNT >= nextDump:
+                    nextDump += dump_every
+                    bot.dump_qvalues(force=True)
+                    logging.info(f"Game count: {bot.gameCNT}, mean score of last 100: {np.mean(scores[-100:]):.1f}")
+
+            for proc in procs:
+                proc.join()
+            check_workers(procs)
+        finally:
+            for proc in procs:
+                if proc.is_alive():
+                    proc.terminate()
+                    proc.join()
+
+        bot.qvalues = shared.copy()
+        if track_dirty:
+            bot.dirty = dirty.copy()
+        del shared, dirty
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return bot, scores
+
+
+def main():
+    parser = argparse.ArgumentParser("learn_parallel.py")
+    parser.add_argument("--iter", type=int, default=1000, help="number of iterations to run, over all workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the workers' pipe generators")
+    parser.add_argument("--dump-every", type=int, default=1000, help="games between two dumps of the Q values")
+    parser.add_argument("--max-frames", type=int, default=0, help="truncate games after this many frames, 0 = no cap")
+    parser.add_argument("--max-score", type=int, default=0, help="truncate games at this score, 0 = no cap")
+    parser.add_argument("--compact-every", type=int, default=None, help="dumps appending to the delta log per snapshot")
+    parser.add_argument("--stats", type=Path, default=None, help="append score statistics to this CSV/JSONL file")
+    parser.add_argument("--stats-every", type=int, default=100, help="games between two score statistics lines")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    start_time = time.time()
+    stats = ScoreStats()
+    if args.stats is not None:
+        stats.open(args.stats, args.stats_every)
+
+    bot, scores = train(
+        args.iter, args.workers, args.seed, args.dump_every, stats, args.max_frames, args.max_score, args.compact_every
+    )
+    bot.dump_qvalues(force=True)
+    bot.close()
+    stats.close()
+
+    elapsed = time.time() - start_time
+    logging.info("Time taken: " + str(elapsed))
+    logging.info(f"Games: {len(scores)}, games/sec: {len(scores) / elapsed:.1f}, mean score: {np.mean(scores):.1f}")
+    if args.max_frames or args.max_score:
+        logging.info(f"Truncated games: {bot.truncatedCNT}")
+
+
+if __name__ == "__main__":
+    main()
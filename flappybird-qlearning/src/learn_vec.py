@@ -0,0 +1,321 @@
+"""
+Batch trainer: steps N independent headless games together as NumPy arrays.
+
+Same game rules as learn.py (one bird per mainGame call), but the player y, velocity, pipes,
+discretized states and greedy actions of all N games are arrays. Crashed games are reset with
+a mask and their finished trajectories go through the backward Q update of Bot.update_scores.
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+from time import perf_counter_ns
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from bot import Bot
+from collision_table import load_table
+from flappy_sim import (
+    BASEY,
+    PIPE_H,
+    PIPE_VEL_X,
+    PIPE_W,
+    PIPEGAPSIZE,
+    PLAYER_ACC_Y,
+    PLAYER_FLAP_ACC,
+    PLAYER_H,
+    PLAYER_INDEX_CYCLE,
+    PLAYER_MAX_VEL_Y,
+    PLAYER_MID,
+    PLAYER_START_Y,
+    PLAYER_W,
+    PLAYERX,
+    SCREENWIDTH,
+    PipeStream,
+)
+from phase_counters import COUNTERS
+from score_stats import ScoreStats
+
+INDEX_CYCLE = np.array(PLAYER_INDEX_CYCLE)
+
+MAX_PIPES = 3  # at most 3 pipe pairs are alive at the same time
+NO_PIPE_X = 10**6  # x of an empty pipe slot, far away from the player
+
+
+class VecFlappy(object):
+    """
+    N headless Flappy Bird games stepped together, every attribute is an array over the games
+    """
+
+    def __init__(self, n_envs, rng=None, crash_table=None):
+        self.n_envs = n_envs
+        self.rng = rng if rng is not None else PipeStream()
+        self.crash_table = (crash_table if crash_table is not None else load_table()).table
+
+        self.playery = np.zeros(n_envs)  # float, as BASEY clamps the bird to a fractional height
+        self.playerVelY = np.zeros(n_envs, dtype=np.int64)
+        self.loopIter = np.zeros(n_envs, dtype=np.int64)  # frames played, not wrapped
+        self.score = np.zeros(n_envs, dtype=np.int64)
+        self.pipeX = np.full((n_envs, MAX_PIPES), NO_PIPE_X, dtype=np.int64)
+        self.upperY = np.zeros((n_envs, MAX_PIPES), dtype=np.int64)
+        self.lowerY = np.zeros((n_envs, MAX_PIPES), dtype=np.int64)
+        self.nPipes = np.zeros(n_envs, dtype=np.int64)
+
+        self.reset(np.ones(n_envs, dtype=bool))
+
+    def random_gaps(self, size):
+        """y of the gaps between upper and lower pipes, same range as getRandomPipe"""
+        return self.rng.gaps(int(np.prod(size))).reshape(size)
+
+    def reset(self, mask):
+        """Restart the games selected by the boolean mask"""
+        n = int(np.count_nonzero(mask))
+        if n == 0:
+            return
+
+        gaps = self.random_gaps((n, 2))
+        self.playery[mask] = PLAYER_START_Y
+        self.playerVelY[mask] = PLAYER_FLAP_ACC
+        self.loopIter[mask] = 0
+        self.score[mask] = 0
+        self.pipeX[mask] = [SCREENWIDTH + 200, SCREENWIDTH + 200 + SCREENWIDTH // 2, NO_PIPE_X]
+        self.upperY[mask, :2] = gaps - PIPE_H
+        self.lowerY[mask, :2] = gaps + PIPEGAPSIZE
+        self.nPipes[mask] = 2
+
+    def keep(self, mask):
+        """Drop the games not selected by the boolean mask, the kept ones go on in the same order"""
+        for name in ("playery", "playerVelY", "loopIter", "score", "pipeX", "upperY", "lowerY", "nPipes"):
+            setattr(self, name, getattr(self, name)[mask])
+        self.n_envs = int(np.count_nonzero(mask))
+
+    def observe(self):
+        """Returns the (xdif, ydif, vel) arrays the bot acts on"""
+        front = (self.pipeX[:, 0] - PLAYERX > -30).astype(np.int64)
+        rows = np.arange(self.n_envs)
+        col = 1 - front
+        return self.pipeX[rows, col] - PLAYERX, self.lowerY[rows, col] - self.playery, self.playerVelY.copy()
+
+    def step(self, actions):
+        """
+        Advance every game by one frame with the given flap actions.
+        Returns the boolean crash mask and the scores; crashed games must be reset by the caller.
+        """
+        flapped = np.asarray(actions, dtype=bool) & (self.playery > -2 * PLAYER_H)
+        self.playerVelY[flapped] = PLAYER_FLAP_ACC
+
+        # check for crash here, with the state the bot acted on
+        crashed = self.check_crash()
+        scores = self.score.copy()
+
+        # check for score
+        pipeMidPos = self.pipeX + PIPE_W / 2
+        self.score += np.count_nonzero((pipeMidPos <= PLAYER_MID) & (PLAYER_MID < pipeMidPos + 4), axis=1)
+
+        self.loopIter += 1
+
+        # player's movement
+        accelerate = ~flapped & (self.playerVelY < PLAYER_MAX_VEL_Y)
+        self.playerVelY[accelerate] += PLAYER_ACC_Y
+        self.playery += np.minimum(self.playerVelY, BASEY - self.playery - PLAYER_H)
+
+        # move pipes to left, empty slots stay put
+        alive = np.arange(MAX_PIPES) < self.nPipes[:, None]
+        self.pipeX[alive] += PIPE_VEL_X
+
+        # add new pipe when first pipe is about to touch left of screen, crashed games draw no pipe
+        spawn = ~crashed & (0 < self.pipeX[:, 0]) & (self.pipeX[:, 0] < 5)
+        if spawn.any():
+            rows = np.flatnonzero(spawn)
+            cols = self.nPipes[rows]
+            gaps = self.random_gaps(rows.size)
+            self.pipeX[rows, cols] = SCREENWIDTH + 10
+            self.upperY[rows, cols] = gaps - PIPE_H
+            self.lowerY[rows, cols] = gaps + PIPEGAPSIZE
+            self.nPipes[rows] += 1
+
+        # remove first pipe if its out of the screen
+        remove = self.pipeX[:, 0] < -PIPE_W
+        if remove.any():
+            for arr in (self.pipeX, self.upperY, self.lowerY):
+                arr[remove, :-1] = arr[remove, 1:]
+            self.pipeX[remove, -1] = NO_PIPE_X
+            self.nPipes[remove] -= 1
+
+        return crashed, scores
+
+    def player_index(self):
+        """Animation frame of every player, the playerIndexGen cycle advanced every 3rd frame"""
+        ticks = self.loopIter // 3
+        return np.where(ticks == 0, 0, INDEX_CYCLE[(ticks - 1) % len(INDEX_CYCLE)])
+
+    def check_crash(self):
+        """returns True for every player that collides with base, top or pipes."""
+        bottom = self.playery + PLAYER_H
+        crashed = (bottom >= BASEY - 1) | (bottom <= 0)
+
+        # pixel test, looked up only for players whose box overlaps a pipe box
+        offsetX = PLAYERX - self.pipeX
+        near = ~crashed[:, None] & (offsetX > -PLAYER_W) & (offsetX < PIPE_W)
+        rows, cols = np.nonzero(near)
+        if rows.size == 0:
+            return crashed
+
+        frame = self.player_index()[rows]
+        dx = offsetX[rows, cols] + PLAYER_W - 1
+        py = self.playery[rows].astype(np.int64)
+        for i, pipeY in enumerate((self.upperY, self.lowerY)):
+            dy = py - pipeY[rows, cols] + PLAYER_H - 1
+            inside = (dy >= 0) & (dy < self.crash_table.shape[3])
+            hit = self.crash_table[frame[inside], i, dx[inside], dy[inside]]
+            crashed[rows[inside][hit]] = True
+
+        return crashed
+
+
+def train(bot, n_envs, iterations, rng=None, verbose=False, stats=None, max_frames=0, max_score=0):
+    """
+    Play `iterations` games with n_envs games in flight, returns the score of every finished game.
+    The bot must be dense, its Q table is updated after every crash, as in learn.py.
+    stats is a ScoreStats fed every score (see score_stats.py), max_frames and max_score cap the games.
+    """
+    scores = []
+    for score in iter_games(bot, n_envs, iterations, rng, max_frames, max_score):
+        scores.append(score)
+        if stats is not None:
+            stats.add(score)
+        if verbose:
+            print(str(bot.gameCNT - 1) + " | " + str(score))
+    return scores
+
+
+def iter_games(bot, n_envs, iterations, rng=None, max_frames=0, max_score=0):
+    """
+    Same as train, but yields the score of every game as it finishes. Games are truncated after
+    max_frames frames or once their score reaches max_score (0 = no cap), as in FlappySim.play.
+    Exactly `iterations` games are started, and all of them are played to their end: once the last one
+    is started, the ended games are dropped from the batch instead of restarted, so the scores are not
+    biased towards the games that finish first.
+    """
+    if not bot.dense:
+        raise ValueError("The batch trainer needs a Bot(dense=True)")
+
+    n_envs = min(n_envs, iterations)
+    sim = VecFlappy(n_envs, rng)
+    rows = np.arange(n_envs)
+
+    # per game last state/action, carried over between games like Bot.last_state
+    lastState = np.full(n_envs, bot.last_state, dtype=np.int64)
+    lastAction = np.zeros(n_envs, dtype=np.int64)
+
+    # growable (state, action, next state) history of every game in flight
+    capacity = 1024
+    histState = np.zeros((n_envs, capacity), dtype=np.int32)
+    histAction = np.zeros((n_envs, capacity), dtype=np.int8)
+    histNext = np.zeros((n_envs, capacity), dtype=np.int32)
+    histLen = np.zeros(n_envs, dtype=np.int64)
+
+    finished = 0
+    started = n_envs
+    COUNTERS.first_frame()
+    while finished < iterations:
+        t0 = perf_counter_ns()
+        state = bot.map_state_indices(*sim.observe())
+
+        if histLen.max() >= capacity:
+            pad = ((0, 0), (0, capacity))
+            histState, histAction, histNext = (np.pad(h, pad) for h in (histState, histAction, histNext))
+            capacity *= 2
+
+        histState[rows, histLen] = lastState
+        histAction[rows, histLen] = lastAction
+        histNext[rows, histLen] = state
+        histLen += 1
+
+        q = bot.qvalues[state]
+        action = q[:, 1] > q[:, 0]  # chooses 0 (don't flap) to tie-break
+        lastState = state
+        lastAction = action.astype(np.int64)
+
+        t1 = perf_counter_ns()
+        crashed, gameScores = sim.step(action)
+        t2 = perf_counter_ns()
+        COUNTERS.add("act", t1 - t0, sim.n_envs)
+        COUNTERS.add("step", t2 - t1, sim.n_envs)
+
+        # games that reached a cap without crashing end with their score after this frame
+        truncated = np.zeros(sim.n_envs, dtype=bool)
+        if max_frames:
+            truncated |= histLen >= max_frames
+        if max_score:
+            truncated |= sim.score >= max_score
+        truncated &= ~crashed
+        if truncated.any():
+            gameScores[truncated] = sim.score[truncated]
+
+        ended = crashed | truncated
+        for env in np.flatnonzero(ended):
+            n = histLen[env]
+            moves = (histState[env, :n], histAction[env, :n], histNext[env, :n])
+            bot.update_scores(dump_qvalues=False, moves=moves, truncated=bool(truncated[env]))
+            finished += 1
+            yield int(gameScores[env])
+
+        # restart the ended games while games are left to start, drop the others
+        restart = np.zeros(sim.n_envs, dtype=bool)
+        restart[np.flatnonzero(ended)[: iterations - started]] = True
+        started += int(np.count_nonzero(restart))
+        histLen[restart] = 0
+        sim.reset(restart)
+        dropped = ended & ~restart
+        if dropped.any():
+            kept = ~dropped
+            sim.keep(kept)
+            rows = np.arange(sim.n_envs)
+            lastState, lastAction = lastState[kept], lastAction[kept]
+            histState, histAction, histNext, histLen = histState[kept], histAction[kept], histNext[kept], histLen[kept]
+
+
+def main():
+    parser = argparse.ArgumentParser("learn_vec.py")
+    parser.add_argument("--iter", type=int, default=1000, help="number of iterations to run")
+    parser.add_argument("--envs", type=int, default=256, help="number of games stepped together")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the pipe generator")
+    parser.add_argument("--verbose", action="store_true", help="output [iteration | score] to stdout")
+    parser.add_argument("--timings", type=Path, default=None, help="append per-phase timing JSON lines to this file")
+    parser.add_argument("--timings-every", type=int, default=100, help="games between two timing lines")
+    parser.add_argument("--max-frames", type=int, default=0, help="truncate games after this many frames, 0 = no cap")
+    parser.add_argument("--max-score", type=int, default=0, help="truncate games at this score, 0 = no cap")
+    parser.add_argument("--stats", type=Path, default=None, help="append score statistics to this CSV/JSONL file")
+    parser.add_argument("--stats-every", type=int, default=100, help="games between two score statistics lines")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    start_time = time.time()
+    if args.timings is not None:
+        COUNTERS.open(args.timings, args.timings_every)
+    stats = ScoreStats()
+    if args.stats is not None:
+        stats.open(args.stats, args.stats_every)
+
+    bot = Bot(dense=True)
+    scores = train(
+        bot, args.envs, args.iter, PipeStream(args.seed), args.verbose, stats, args.max_frames, args.max_score
+    )
+    bot.dump_qvalues(force=True)
+    COUNTERS.close()
+    stats.close()
+
+    elapsed = time.time() - start_time
+    logging.info("Time taken: " + str(elapsed))
+    logging.info(f"Games: {len(scores)}, games/sec: {len(scores) / elapsed:.1f}, mean score: {np.mean(scores):.1f}")
+    if args.max_frames or args.max_score:
+        logging.info(f"Truncated games: {bot.truncatedCNT}")
+
+
+if __name__ == "__main__":
+    main()
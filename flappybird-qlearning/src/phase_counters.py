@@ -0,0 +1,81 @@
+"""
+Always-on cumulative timing counters of the training phases.
+
+The simulators and the bot add perf_counter_ns deltas to the process-wide COUNTERS (the hot loops sum
+them in local variables and add them once per game). Counting costs a few perf_counter_ns calls per
+frame, cheap enough to leave on in long runs. Once open() gave it a file, COUNTERS appends a JSON line
+with the cumulative totals every `every` games:
+
+    {"time": ..., "games": 100, "truncated": 0, "elapsed_ns": ..., "first_frame_time": ..., "phases": {"act": {...}, ...}}
+
+first_frame_time is the wall time (time.time()) at which the first frame was simulated, the end of the
+process start-up: bench.py --startup subtracts the time it spawned the trainer.
+"""
+
+import json
+import time
+from time import perf_counter_ns
+
+
+class PhaseCounters(object):
+    """Cumulative nanoseconds and call counts per phase name, plus the number of finished games"""
+
+    __slots__ = ("ns", "calls", "games", "truncated", "start_ns", "first_frame_time", "stream", "every")
+
+    def __init__(self):
+        self.ns = {}
+        self.calls = {}
+        self.games = 0
+        self.truncated = 0
+        self.start_ns = perf_counter_ns()
+        self.first_frame_time = None
+        self.stream = None
+        self.every = 100
+
+    def add(self, phase, ns, calls=1):
+        """Adds ns nanoseconds spent in `calls` calls of phase"""
+        self.ns[phase] = self.ns.get(phase, 0) + ns
+        self.calls[phase] = self.calls.get(phase, 0) + calls
+
+    def first_frame(self):
+        """Records the wall time of the first simulated frame, later calls are ignored"""
+        if self.first_frame_time is None:
+            self.first_frame_time = time.time()
+
+    def game_done(self, truncated=False):
+        """Counts a finished game (truncated at a frame or score cap or not), emits the totals every `every` games"""
+        self.games += 1
+        self.truncated += truncated
+        if self.stream is not None and self.games % self.every == 0:
+            self.emit()
+
+    def snapshot(self):
+        """The cumulative totals as a JSON-able dict"""
+        return {
+            "time": time.time(),
+            "games": self.games,
+            "truncated": self.truncated,
+            "elapsed_ns": perf_counter_ns() - self.start_ns,
+            "first_frame_time": self.first_frame_time,
+            "phases": {phase: {"ns": ns, "calls": self.calls[phase]} for phase, ns in self.ns.items()},
+        }
+
+    def emit(self):
+        """Appends the totals as one JSON line"""
+        self.stream.write(json.dumps(self.snapshot()) + "\n")
+        self.stream.flush()
+
+    def open(self, path, every=100):
+        """Starts emitting to the JSON lines file at path (appended to)"""
+        self.stream = open(path, "a")
+        self.every = every
+
+    def close(self):
+        """Emits the final totals and closes the file"""
+        if self.stream is not None:
+            self.emit()
+            self.stream.close()
+            self.stream = None
+
+
+COUNTERS = PhaseCounters()
@@ -0,0 +1,114 @@
+"""
+Frozen greedy policy of a Q table.
+
+save_policy compiles a table into the greedy action of every state of its grid (0, don't flap, on ties),
+packed 8 states per byte: 3.2 kB for the 10px grid. A policy file is a 4-byte magic, a uint32 header
+length, a JSON header (the discretization spec and grid) and the packed bits. GreedyPolicy loads it and
+acts with a single read of the unpacked actions per frame, at the state index summed from the lookup
+arrays of the discretization. It plays exactly like a Bot(learning=False) on the table, and has the
+interface flappy.py and flappy_sim.play_games (python backend) use:
+
+    python policy.py --qvalues ../data/qvalues-trained.json --output ../data/greedy.policy
+    python flappy.py --policy ../data/greedy.policy
+"""
+
+import argparse
+import json
+import struct
+from pathlib import Path
+
+import numpy as np
+from discretization import RAW_LIMIT, SPECS, VEL_LIMIT, Discretization
+from phase_counters import COUNTERS
+from qvalues_io import load_table, write_atomic
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+POLICY_PATH = DATA_DIR / "greedy.policy"
+
+MAGIC = b"QPOL"
+PREFIX = struct.Struct("<4sI")  # magic, header length
+
+
+def greedy_actions(qvalues):
+    """Boolean greedy action of every state of the (n_states, 2) table"""
+    qvalues = np.asarray(qvalues)
+    return qvalues[:, 1] > qvalues[:, 0]
+
+
+def save_policy(path, qvalues, spec):
+    """Atomically write the packed greedy actions of the table of the discretization spec"""
+    states = Discretization(spec)
+    actions = greedy_actions(qvalues)
+    if len(actions) != states.n_states:
+        raise ValueError(f"The table has {len(actions)} states, the grid {states.n_states}")
+    header = json.dumps({"spec": spec, "grid": states.grid}).encode()
+    write_atomic(path, (PREFIX.pack(MAGIC, len(header)), header, np.packbits(actions).tobytes()))
+
+
+def read_policy(path):
+    """The header dict and the boolean greedy actions of a policy file"""
+    with open(path, "rb") as fil:
+        magic, length = PREFIX.unpack(fil.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a policy file")
+        header = json.loads(fil.read(length))
+        bits = np.frombuffer(fil.read(), dtype=np.uint8)
+    n_states = Discretization(header["spec"]).n_states
+    return header, np.unpackbits(bits, count=n_states).astype(bool)
+
+
+class GreedyPolicy(object):
+    """
+    Acts greedily from the actions of a policy file and never learns. update_scores only counts the games,
+    like a Bot(learning=False).
+    """
+
+    dense = False
+    learning = False
+
+    def __init__(self, path=POLICY_PATH):
+        header, actions = read_policy(path)
+        self.states = Discretization(header["spec"])
+        self.actions = bytes(actions)  # one byte per state, the fastest to index one at a time
+        self.x_list, self.y_list, self.v_list = self.states.x_list, self.states.y_list, self.states.v_list
+        self.gameCNT = 0
+        self.truncatedCNT = 0
+
+    def act(self, xdif, ydif, vel):
+        """The greedy action of the state of (xdif, ydif, vel)"""
+        return self.actions[
+            self.x_list[int(xdif) + RAW_LIMIT] + self.y_list[int(ydif) + RAW_LIMIT] + self.v_list[vel + VEL_LIMIT]
+        ]
+
+    def update_scores(self, dump_qvalues=True, moves=None, truncated=False):
+        """Counts a finished game"""
+        self.gameCNT += 1
+        self.truncatedCNT += truncated
+        COUNTERS.game_done(truncated)
+
+    def table(self):
+        """An (n_states, 2) table with the same greedy actions, for the compiled backends"""
+        table = np.zeros((self.states.n_states, 2))
+        table[:, 1] = np.frombuffer(self.actions, dtype=np.uint8)
+        return table
+
+
+def main():
+    parser = argparse.ArgumentParser("policy.py")
+    parser.add_argument("--qvalues", type=Path, default=DATA_DIR / "qvalues-trained.json", help="JSON or .bin table")
+    parser.add_argument(
+        "--grid",
+        choices=list(SPECS),
+        default="10px",
+        help="state discretization of the policy, a table of another grid is projected",
+    )
+    parser.add_argument("--output", type=Path, default=POLICY_PATH, help="policy file to write")
+    args = parser.parse_args()
+
+    spec = SPECS[args.grid]
+    save_policy(args.output, load_table(args.qvalues, spec), spec)
+    print(f"{args.output}: {args.output.stat().st_size} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Binary, memory-mappable Q value files.
+
+Layout: 4-byte magic, uint32 version, uint32 header length, a JSON header describing the grid, the dtype
+and the shape (space-padded so the data starts 64-byte aligned), then the raw C-order table. Files are
+written through a temp file and an atomic rename, so readers see either the old or the new table, and
+any number of processes can map the same file read-only.
+
+Between two full snapshots, checkpoints can append only the changed rows to a delta log: a 16-byte
+prefix (magic, version, id of the snapshot it follows) then packed (int32 index, float64 q0, float64 q1)
+records. The snapshot header holds the same log_id, a log left over from another snapshot (e.g. a crash
+between writing a new snapshot and starting its log) is ignored. load_checkpoint replays the records of
+the matching log over the snapshot, the last record of a row wins and a torn last record is dropped.
+
+read_table finds the named grid (discretization.SPECS) of a JSON or binary table, from the "x_y_v" keys
+or from the header, and load_table projects a table written for another grid onto the requested one
+(Discretization.project), so a table is never read with the states of another grid. A table of an
+unknown grid raises ValueError, whatever its format.
+
+Run as a script to convert between the JSON and the binary files, keeping the grid of the table:
+    python qvalues_io.py --to-json  (or --from-json)
+"""
+
+import argparse
+import json
+import logging
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from discretization import SPECS, Discretization, bin_edges
+
+MAGIC = b"QTAB"
+VERSION = 1
+ALIGN = 64
+PREFIX = struct.Struct("<4sII")  # magic, version, header length
+
+LOG_MAGIC = b"QLOG"
+LOG_PREFIX = struct.Struct("<4sIQ")  # magic, version, log_id of the snapshot
+DELTA = np.dtype([("index", "<i4"), ("q", "<f8", (2,))])  # one changed row of the table
+
+
+def write_atomic(path, chunks):
+    """Writes the byte chunks to a temp file, fsyncs it and renames it to path"""
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fil:
+            os.fchmod(fil.fileno(), 0o644)
+            for chunk in chunks:
+                fil.write(chunk)
+            fil.flush()
+            os.fsync(fil.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def save_qvalues(path, qvalues, grid, log_id=None):
+    """Atomically write the (n_states, 2) table with its grid description, and the id of its delta log"""
+    qvalues = np.ascontiguousarray(qvalues, dtype=np.float64)
+    header = {"grid": grid, "dtype": qvalues.dtype.str, "shape": qvalues.shape}
+    if log_id is not None:
+        header["log_id"] = log_id
+    header = json.dumps(header).encode()
+    header += b" " * (-(PREFIX.size + len(header)) % ALIGN)
+    write_atomic(path, (PREFIX.pack(MAGIC, VERSION, len(header)), header, qvalues.tobytes()))
+
+
+def new_log_id():
+    """A random id tying a delta log to its snapshot"""
+    return int.from_bytes(os.urandom(8), "little")
+
+
+def start_delta_log(path, log_id):
+    """Atomically replaces the delta log at path with an empty log following the snapshot log_id"""
+    write_atomic(path, (LOG_PREFIX.pack(LOG_MAGIC, VERSION, log_id),))
+
+
+def append_deltas(path, indices, rows):
+    """Appends the (index, q0, q1) records of the rows of the table at indices to the delta log"""
+    records = np.empty(len(indices), dtype=DELTA)
+    records["index"] = indices
+    records["q"] = rows
+    with open(path, "ab") as fil:
+        fil.write(records.tobytes())
+
+
+def read_deltas(path, log_id):
+    """The records of the delta log at path, empty if it is missing or follows another snapshot"""
+    try:
+        with open(path, "rb") as fil:
+            magic, version, file_id = LOG_PREFIX.unpack(fil.read(LOG_PREFIX.size))
+            if magic != LOG_MAGIC or version != VERSION or file_id != log_id:
+                return np.empty(0, dtype=DELTA)
+            data = fil.read()
+    except (OSError, struct.error):
+        return np.empty(0, dtype=DELTA)
+    return np.frombuffer(data, dtype=DELTA, count=len(data) // DELTA.itemsize)
+
+
+def apply_deltas(qvalues, deltas):
+    """Writes the delta records into the table in place, the last record of a row wins"""
+    indices = deltas["index"][::-1]
+    _, last = np.unique(indices, return_index=True)
+    qvalues[indices[last]] = deltas["q"][::-1][last]
+
+
+def read_header(path):
+    """Returns the header dict and the offset of the table in the file"""
+    with open(path, "rb") as fil:
+        magic, version, length = PREFIX.unpack(fil.read(PREFIX.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} Q value file")
+        header = json.loads(fil.read(length))
+    return header, PREFIX.size + length
+
+
+def load_qvalues(path, grid=None, mmap=False):
+    """
+    Load the table, as a private in-memory array or, with mmap=True, as a read-only memory map
+    shared with every other process mapping the same file. Raises ValueError if grid is given and
+    the file was written for another grid.
+    """
+    header, offset = read_header(path)
+    if grid is not None and header["grid"] != grid:
+        raise ValueError(f"{path} was written for another state grid")
+
+    dtype, shape = np.dtype(header["dtype"]), tuple(header["shape"])
+    if mmap:
+        return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+    return np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+
+def load_checkpoint(path, log_path, grid=None):
+    """Load the table at path with the records of its delta log at log_path replayed over it"""
+    header, _ = read_header(path)
+    qvalues = load_qvalues(path, grid)
+    if "log_id" in header:
+        apply_deltas(qvalues, read_deltas(log_path, header["log_id"]))
+    return qvalues
+
+
+def json_spec(table, path):
+    """The smallest named grid (SPECS) having the x, y and v values of every "x_y_v" key of the JSON table"""
+    values = "_".join(table).split("_") if table else []
+    values = [set(values[axis::3]) for axis in range(3)]
+    for spec in sorted(SPECS.values(), key=lambda spec: len(bin_edges(spec["x"])) * len(bin_edges(spec["y"]))):
+        edges = (bin_edges(spec["x"]), bin_edges(spec["y"]), range(spec["v"][0], spec["v"][1] + 1))
+        if all(axis <= set(map(str, axis_edges)) for axis, axis_edges in zip(values, edges)):
+            return spec
+    raise ValueError(f"{path} was written for an unknown state grid")
+
+
+def grid_spec(grid, path):
+    """The named grid (SPECS) of the grid description of a binary file header"""
+    for spec in SPECS.values():
+        if Discretization(spec).grid == grid:
+            return spec
+    raise ValueError(f"{path} was written for an unknown state grid")
+
+
+def read_table(path):
+    """
+    The dense table of a JSON file keyed by state, or of a binary file with its .delta log, and the
+    spec of the grid it was written for
+    """
+    path = Path(path)
+    if path.suffix == ".json":
+        with open(path, "r") as fil:
+            table = json.load(fil)
+        spec = json_spec(table, path)
+        return np.array([table.get(key, [0, 0]) for key in Discretization(spec).keys], dtype=np.float64), spec
+    header, _ = read_header(path)
+    spec = grid_spec(header["grid"], path)
+    return load_checkpoint(path, path.with_suffix(".delta")), spec
+
+
+def load_table(path, spec):
+    """The dense table of read_table on the grid of spec, projected onto it if written for another grid"""
+    qvalues, source = read_table(path)
+    if source != spec:
+        logging.warning(f"{path} was written for another state grid, its Q values are projected onto this one")
+        qvalues = Discretization(source).project(qvalues, Discretization(spec))
+    return qvalues
+
+
+def main():
+    from bot import DATA_DIR
+
+    parser = argparse.ArgumentParser("qvalues_io.py")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--to-json", action="store_true", help="convert qvalues.bin to qvalues.json")
+    group.add_argument("--from-json", action="store_true", help="convert qvalues.json to qvalues.bin")
+    args = parser.parse_args()
+
+    if args.to_json:
+        qvalues, spec = read_table(DATA_DIR / "qvalues.bin")
+        with open(DATA_DIR / "qvalues.json", "w") as fd:
+            json.dump(dict(zip(Discretization(spec).keys, qvalues.tolist())), fd)
+    else:
+        qvalues, spec = read_table(DATA_DIR / "qvalues.json")
+        save_qvalues(DATA_DIR / "qvalues.bin", qvalues, Discretization(spec).grid)
+
+
+if __name__ == "__main__":
+    main()
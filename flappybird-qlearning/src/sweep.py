@@ -0,0 +1,221 @@
+"""
+Hyperparameter sweep of the Q-learning bot.
+
+Every configuration of the parameter grid (the product of the values given for each parameter) is
+trained from a zero Q table for --runs seeded runs, on a process pool. Run r of every configuration
+plays the same pipe stream, so configurations are compared on identical games. Workers report the
+rolling mean score of their last --window games every --check-every games; the coordinator streams
+the reports to one JSON lines file and stops a configuration, after --min-games games, as soon as one
+of its runs clearly trails: its rolling mean is below --stop-ratio times the best rolling mean seen at
+the same game count, and more than --stop-margin points below it (early scores are small and noisy).
+
+    python sweep.py --lr 0.5 0.7 0.9 --grid 10px 5px --replay 0 4 --iter 3000 --runs 2
+
+Report lines: {"config": 0, "params": {...}, "run": 0, "seed": ..., "games": 100, "rolling_mean": ...,
+"max_score": ..., "done": false}; the last line of a run has "done": true, "stopped", "mean_score" and
+"truncated" (games cut at the --max-frames/--max-score cap).
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing as mp
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from bot import DATA_DIR, Bot
+from discretization import SPECS, Discretization
+from flappy_sim import BACKENDS, PipeStream, play_games, spawn_seeds
+from replay import ReplayStore
+
+PARAMS = ("lr", "discount", "reward_alive", "reward_death", "grid", "replay")
+DEFAULTS = {
+    "lr": [0.7],
+    "discount": [1.0],
+    "reward_alive": [1.0],
+    "reward_death": [-1000.0],
+    "grid": ["10px"],
+    "replay": [0],
+}
+
+_reports = None  # queue of the reports to the coordinator, set in every pool process
+_stopped = None  # per configuration stop flags, set by the coordinator
+
+
+def init_worker(reports, stopped):
+    global _reports, _stopped
+    _reports, _stopped = reports, stopped
+
+
+def make_bot(params, seed=None):
+    """A dense bot with a zero Q table and the configuration's hyperparameters"""
+    spec = SPECS[params["grid"]]
+    replay = ReplayStore(params["replay"], seed=seed) if params["replay"] else None
+    return Bot(
+        qvalues=np.zeros((Discretization(spec).n_states, 2)),
+        lr=params["lr"],
+        discount=params["discount"],
+        rewards=(params["reward_alive"], params["reward_death"]),
+        spec=spec,
+        replay=replay,
+    )
+
+
+def run_config(task):
+    """Plays one seeded run of a configuration, reporting its rolling score every check_every games"""
+    config, params, run, seed, games, backend, window, check_every, max_frames, max_score = task
+    report = {"config": config, "params": params, "run": run, "seed": seed}
+    start = time.perf_counter()
+    scores = []
+    try:
+        bot = make_bot(params, seed)
+        if not _stopped[config]:
+            rng = PipeStream(seed)
+            for score in play_games(bot, games, backend, rng, max_frames=max_frames, max_score=max_score):
+                scores.append(score)
+                if len(scores) % check_every == 0:
+                    recent = scores[-window:]
+                    _reports.put(
+                        dict(report, games=len(scores), rolling_mean=float(np.mean(recent)), max_score=max(scores))
+                    )
+                    if _stopped[config]:
+                        break
+    except BaseException as e:
+        _reports.put(dict(report, done=True, error=repr(e)))
+        raise
+
+    _reports.put(
+        dict(
+            report,
+            done=True,
+            stopped=len(scores) < games,
+            games=len(scores),
+            mean_score=float(np.mean(scores)) if scores else None,
+            rolling_mean=float(np.mean(scores[-window:])) if scores else None,
+            max_score=max(scores, default=None),
+            truncated=bot.truncatedCNT,
+            elapsed_s=time.perf_counter() - start,
+        )
+    )
+
+
+def sweep(
+    grid,
+    games,
+    output,
+    runs=1,
+    workers=None,
+    seed=None,
+    backend="numba",
+    window=100,
+    check_every=100,
+    min_games=500,
+    stop_ratio=0.5,
+    stop_margin=10.0,
+    max_frames=0,
+    max_score=0,
+):
+    """
+    Runs the sweep of grid ({parameter: values}), appending the reports to output.
+    Returns the final reports of the runs.
+    """
+    names = [name for name in PARAMS if name in grid]
+    configs = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    seeds = spawn_seeds(seed, runs)
+    # run by run, so that all configurations progress together and can be compared early
+    tasks = [
+        (config, params, run, seeds[run], games, backend, window, check_every, max_frames, max_score)
+        for run in range(runs)
+        for config, params in enumerate(configs)
+    ]
+
+    reports = mp.Queue()
+    stopped = mp.Array("b", len(configs), lock=False)
+    best = {}  # best rolling mean at every game count
+    finals = []
+    with mp.Pool(workers, init_worker, (reports, stopped)) as pool, open(output, "a") as out:
+        pending = pool.map_async(run_config, tasks)
+        while len(finals) < len(tasks):
+            report = reports.get()
+            out.write(json.dumps(report) + "\n")
+            out.flush()
+            if report.get("done"):
+                finals.append(report)
+                continue
+
+            config, count, mean = report["config"], report["games"], report["rolling_mean"]
+            best[count] = max(best.get(count, mean), mean)
+            trails = mean < stop_ratio * best[count] and mean < best[count] - stop_margin
+            if min_games <= count < games and trails and not stopped[config]:
+                stopped[config] = 1
+                logging.info(f"Stopped {configs[config]} at {count} games: {mean:.1f} against {best[count]:.1f}")
+        pending.get()  # re-raises the error of a failed run
+
+    return finals
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("sweep.py")
+    parser.add_argument("--lr", type=float, nargs="+", default=DEFAULTS["lr"], help="learning rates")
+    parser.add_argument("--discount", type=float, nargs="+", default=DEFAULTS["discount"], help="discount factors")
+    parser.add_argument("--reward-alive", type=float, nargs="+", default=DEFAULTS["reward_alive"], help="alive rewards")
+    parser.add_argument("--reward-death", type=float, nargs="+", default=DEFAULTS["reward_death"], help="death rewards")
+    parser.add_argument("--grid", nargs="+", choices=list(SPECS), default=DEFAULTS["grid"], help="state grids")
+    parser.add_argument("--replay", type=int, nargs="+", default=DEFAULTS["replay"], help="replayed games per game")
+    parser.add_argument("--iter", type=int, default=2000, help="games per run")
+    parser.add_argument("--runs", type=int, default=1, help="seeded runs per configuration")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the runs' pipe generators")
+    parser.add_argument("--backend", choices=BACKENDS, default="numba", help="simulator backend (see flappy_sim.py)")
+    parser.add_argument("--window", type=int, default=100, help="games in the rolling mean score")
+    parser.add_argument("--check-every", type=int, default=100, help="games between two reports of a run")
+    parser.add_argument("--min-games", type=int, default=500, help="games played before a configuration can stop")
+    parser.add_argument("--stop-ratio", type=float, default=0.5, help="stop below this fraction of the best")
+    parser.add_argument("--stop-margin", type=float, default=10.0, help="and this many points below the best")
+    parser.add_argument("--max-frames", type=int, default=0, help="truncate games after this many frames, 0 = no cap")
+    parser.add_argument("--max-score", type=int, default=0, help="truncate games at this score, 0 = no cap")
+    parser.add_argument("--output", type=Path, default=DATA_DIR / "sweep.jsonl", help="JSON lines results file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+    start_time = time.time()
+
+    grid = {name: getattr(args, name) for name in PARAMS}
+    finals = sweep(
+        grid,
+        args.iter,
+        args.output,
+        args.runs,
+        args.workers,
+        args.seed,
+        args.backend,
+        args.window,
+        args.check_every,
+        args.min_games,
+        args.stop_ratio,
+        args.stop_margin,
+        args.max_frames,
+        args.max_score,
+    )
+
+    # configurations ranked by the mean over their runs of the final rolling mean
+    ranking = {}
+    for report in finals:
+        ranking.setdefault(json.dumps(report["params"]), []).append(report["rolling_mean"] or 0.0)
+    for params, means in sorted(ranking.items(), key=lambda item: -np.mean(item[1])):
+        logging.info(f"{params}: rolling mean score {np.mean(means):.1f}")
+    logging.info("Time taken: " + str(time.time() - start_time))
+
+
+if __name__ == "__main__":
+    main()
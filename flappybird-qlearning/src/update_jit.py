@@ -0,0 +1,31 @@
+"""
+Numba-compiled backward Q update of the dense mode.
+
+backward_update walks a game's (state, action, next state) history from the last experience to the
+first, with the reward shaping of Bot.update_scores: the last two experiences are punished, and so is
+the last flap when the bird died high (in the top pipe).
+"""
+
+import numba as nb
+
+
+@nb.njit(cache=True)
+def backward_update(qvalues, states, actions, next_states, lr, discount, r0, r1, high_death_flag):
+    """Updates the (N_STATES, 2) qvalues in place, same order and arithmetic as Bot.update_scores"""
+    n = len(states)
+    for i in range(n - 1, -1, -1):
+        state = states[i]
+        act = actions[i]
+
+        # Select reward
+        if i >= n - 2:
+            cur_reward = r1
+        elif high_death_flag and act:
+            cur_reward = r1
+            high_death_flag = False
+        else:
+            cur_reward = r0
+
+        res_state = next_states[i]
+        q_max = max(qvalues[res_state, 0], qvalues[res_state, 1])
+        qvalues[state, act] = (1 - lr) * qvalues[state, act] + lr * (cur_reward + discount * q_max)